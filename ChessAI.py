@@ -1,78 +1,133 @@
+import json
 import random
-from typing import Counter
-
-pieceScores = {"K": 0, "Q": 9, "B": 3, "N": 3, "p": 1, "R": 5}
-knightScore = [
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-]
-bishopScore = [
-    [4, 3, 2, 1, 1, 2, 3, 4],
-    [3, 4, 3, 2, 2, 3, 4, 3],
-    [2, 3, 4, 3, 3, 4, 3, 2],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [2, 3, 4, 3, 3, 4, 3, 2],
-    [3, 4, 3, 2, 2, 3, 4, 3],
-    [4, 3, 2, 1, 1, 2, 3, 4],
-]
-rookScore = [
-    [4, 3, 4, 4, 4, 4, 3, 4],
-    [4, 4, 4, 4, 4, 4, 4, 4],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [4, 4, 4, 4, 4, 4, 4, 4],
-    [4, 3, 4, 4, 4, 4, 3, 4],
-]
-queenScore = [
-    [1, 1, 1, 3, 1, 1, 1, 1],
-    [1, 2, 3, 3, 3, 1, 1, 1],
-    [1, 4, 3, 3, 3, 4, 2, 1],
-    [1, 2, 3, 3, 3, 2, 2, 1],
-    [1, 2, 3, 3, 3, 2, 2, 1],
-    [1, 4, 3, 3, 3, 4, 2, 1],
-    [1, 1, 2, 3, 3, 1, 1, 1],
-    [1, 1, 1, 3, 1, 1, 1, 1],
-]
-wpawnScore = [
-    [9, 9, 9, 9, 9, 9, 9, 9],
-    [8, 8, 8, 8, 8, 8, 8, 8],
-    [3, 4, 5, 6, 6, 5, 4, 3],
-    [2, 3, 4, 5, 5, 4, 3, 2],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [1, 1, 1, 0, 0, 1, 1, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-]
-bpawnScore = [
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 1, 1, 0, 0, 1, 1, 1],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [2, 3, 4, 5, 5, 4, 3, 2],
-    [3, 4, 5, 6, 6, 5, 4, 3],
-    [8, 8, 8, 8, 8, 8, 8, 8],
-    [9, 9, 9, 9, 9, 9, 9, 9],
-]
-piecePositionScores = {
-    "N": knightScore,
-    "Q": queenScore,
-    "B": bishopScore,
-    "R": rookScore,
-    "wp": wpawnScore,
-    "bp": bpawnScore,
-}
-CHECKMATE = 1000
+import time
+from multiprocessing import Event, Process
+
+from ChessBook import BOOK_DEPTH, OpeningBook
+from ChessEvaluation import PIECE_VALUES, computeBoardScore, pieceScores
+from ChessTablebase import TABLEBASE_PIECES, Tablebase
+from ChessTranspositionTable import (
+    EXACT,
+    LOWER_BOUND,
+    UPPER_BOUND,
+    TranspositionTable,
+)
+
+# Scores are in centipawns
+CHECKMATE = 100000
+TABLEBASE_WIN = CHECKMATE // 2  # Less than any mate, so a mate is still preferred
 STALEMATE = 0
-DEPTH = 3
+DELTA_MARGIN = 200  # Positional swing a capture may bring beyond the piece it wins
+DEBUG_EVALUATION = False  # Check the incremental score against a full recount
+DEPTH = 3  # Search depth when no time or node limit is given
+MAX_DEPTH = 64
+SEARCH_WORKERS = 1  # Processes searching each move; 1 searches in this process only
+# Search algorithms
+ALPHA_BETA = "alphabeta"  # Every move with the full window
+PRINCIPAL_VARIATION = "pvs"  # Moves after the first with a null window first
+SEARCH_ALGORITHMS = (ALPHA_BETA, PRINCIPAL_VARIATION)
+SEARCH_ALGORITHM = ALPHA_BETA
+# Selective search, each off by default so it can be tried in matches first
+NULL_MOVE_PRUNING = False
+NULL_MOVE_DEPTH = 3  # Shallowest depth to try passing at
+NULL_MOVE_REDUCTION = 2  # 3 from depth 6
+LATE_MOVE_REDUCTIONS = False
+LATE_MOVE_DEPTH = 3  # Shallowest depth to reduce at
+LATE_MOVE_NUMBER = 3  # Moves searched in full before reducing; 2 plies from move 6
+FUTILITY_PRUNING = False  # Skip quiet moves that can't raise alpha near the leaves
+REVERSE_FUTILITY_PRUNING = False  # Cut off when far above beta near the leaves
+FUTILITY_DEPTH = 3  # Deepest depth either futility pruning is used at
+FUTILITY_MARGIN = 150  # Per ply of depth left
+
+# Move ordering
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+PROMOTION_SCORE = 95000
+KILLER_SCORES = (90000, 80000)
+victimValues = {"K": 0, "Q": 900, "R": 500, "B": 330, "N": 320, "p": 100}
+attackerValues = {"K": 10, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+TRANSPOSITION_TABLE_MB = 16
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+"""
+What one search did: node counts, cutoffs, transposition table use, where
+the time went (when profiled) and a summary of every finished depth
+"""
+
+
+class SearchStats:
+    def __init__(self, profiled=False):
+        self.profiled = profiled
+        self.nodes = 0  # Main search nodes
+        self.qnodes = 0  # Quiescence search nodes
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0  # Cutoffs by the first move searched
+        self.researches = 0  # PVS null window searches that had to be repeated
+        self.nullMoveCutoffs = 0
+        self.reductions = 0  # Late moves searched to a reduced depth
+        self.futilityPrunes = 0  # Quiet moves skipped by futility pruning
+        self.reverseFutilityCutoffs = 0
+        self.tableProbes = 0
+        self.tableHits = 0
+        self.seconds = 0.0
+        self.times = {"moveGeneration": 0.0, "evaluation": 0.0, "makeUndo": 0.0}
+        self.depths = []
+        self.bookMove = None  # The move, when it came from the opening book
+        self.tablebaseMove = None  # The move, when it came from the tablebases
+        self.tablebaseHits = 0  # Positions the search scored from the tablebases
+        self.countedNodes = 0  # Nodes already assigned to a depth
+
+    def addDepth(self, depth, score, bestMove):
+        nodes = self.nodes + self.qnodes - self.countedNodes
+        self.countedNodes += nodes
+        previous = self.depths[-1] if self.depths else None
+        self.depths.append(
+            {
+                "depth": depth,
+                "score": score,
+                "bestMove": bestMove.getChessNotation() if bestMove else None,
+                "nodes": nodes,
+                # How many times more nodes this depth took than the one before
+                "branchingFactor": (
+                    nodes / previous["nodes"]
+                    if previous and previous["nodes"]
+                    else None
+                ),
+            }
+        )
+
+    def getStats(self):
+        totalNodes = self.nodes + self.qnodes
+        return {
+            "nodes": self.nodes,
+            "qnodes": self.qnodes,
+            "seconds": self.seconds,
+            "nps": int(totalNodes / self.seconds) if self.seconds > 0 else 0,
+            "betaCutoffs": self.betaCutoffs,
+            "researches": self.researches,
+            "nullMoveCutoffs": self.nullMoveCutoffs,
+            "reductions": self.reductions,
+            "futilityPrunes": self.futilityPrunes,
+            "reverseFutilityCutoffs": self.reverseFutilityCutoffs,
+            "firstMoveCutoffRate": (
+                self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0
+            ),
+            "tableHitRate": (
+                self.tableHits / self.tableProbes if self.tableProbes else 0.0
+            ),
+            "times": dict(self.times) if self.profiled else None,
+            "depths": self.depths,
+            "bookMove": self.bookMove,
+            "tablebaseMove": self.tablebaseMove,
+            "tablebaseHits": self.tablebaseHits,
+        }
+
+    def toJSON(self):
+        return json.dumps(self.getStats())
 
 
 def findRandomMove(validMoves):
@@ -115,96 +170,813 @@ Min Max w/o recursion
 #         gs.undoMove()
 #     return bestPlayerMove
 
+
 """
-Helper Method to make first recursive call
+Compatibility wrappers: the module level functions search with one shared
+default Searcher, as the game did before Searcher existed. It is made on first
+use, so processes that only import ChessAI don't allocate its table
 """
 
+defaultSearcher = None
+
+
+def getDefaultSearcher():
+    global defaultSearcher
+    if defaultSearcher is None:
+        defaultSearcher = Searcher()
+    return defaultSearcher
+
+
+def findBestMove(
+    gs, validMoves, returnQueue, timeLimit=None, nodeLimit=None, workers=None
+):
+    returnQueue.put(
+        getDefaultSearcher().findBestMoveParallel(
+            gs, validMoves, timeLimit, nodeLimit, workers=workers
+        )
+    )
+
+
+def findBestMoveIterative(
+    gs, validMoves, timeLimit=None, nodeLimit=None, maxDepth=None
+):
+    return getDefaultSearcher().findBestMoveIterative(
+        gs, validMoves, timeLimit, nodeLimit, maxDepth
+    )
+
 
-def findBestMove(gs, validMoves, returnQueue):
-    global nextMove, counter
-    nextMove = None
-    random.shuffle(validMoves)
-    counter = 0
-    findMoveNegaMaxAlphaBeta(
-        gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1
+def findBestMoveParallel(
+    gs, validMoves, timeLimit=None, nodeLimit=None, maxDepth=None, workers=None
+):
+    return getDefaultSearcher().findBestMoveParallel(
+        gs, validMoves, timeLimit, nodeLimit, maxDepth, workers
     )
-    returnQueue.put(nextMove)
 
 
-def findMoveMinMax(gs, validMoves, depth, whiteToMove):
-    global nextMove
-    if depth == 0:
-        return scoreMaterial(gs.board)
+def setTranspositionTableSize(sizeMB, shared=False):
+    getDefaultSearcher().setTranspositionTableSize(sizeMB, shared)
+
+
+"""
+One search engine: its settings, its tables and the result of its last search.
+Searchers share nothing, so several can search at once in one process (on
+different GameStates), e.g. one per analysis session or one per thread
+"""
+
+
+class Searcher:
+    def __init__(
+        self,
+        depth=DEPTH,
+        workers=SEARCH_WORKERS,
+        deltaMargin=DELTA_MARGIN,
+        algorithm=SEARCH_ALGORITHM,
+        nullMovePruning=NULL_MOVE_PRUNING,
+        lateMoveReductions=LATE_MOVE_REDUCTIONS,
+        futilityPruning=FUTILITY_PRUNING,
+        reverseFutilityPruning=REVERSE_FUTILITY_PRUNING,
+        tableSizeMB=TRANSPOSITION_TABLE_MB,
+        sharedTable=False,
+        transpositionTable=None,
+        profile=False,
+        bookPath=None,
+        bookDepth=BOOK_DEPTH,
+        tablebasePath=None,
+        tablebasePieces=TABLEBASE_PIECES,
+    ):
+        # Settings
+        self.depth = depth  # Search depth when no time or node limit is given
+        self.workers = workers  # Processes per search; 1 searches in this process only
+        self.deltaMargin = deltaMargin
+        if algorithm not in SEARCH_ALGORITHMS:
+            raise ValueError("Unknown search algorithm: " + str(algorithm))
+        self.algorithm = algorithm
+        self.nullMovePruning = nullMovePruning
+        self.lateMoveReductions = lateMoveReductions
+        self.futilityPruning = futilityPruning
+        self.reverseFutilityPruning = reverseFutilityPruning
+        self.profile = profile  # Time move generation, evaluation and make/undo
+        if transpositionTable is None:
+            transpositionTable = TranspositionTable(tableSizeMB, sharedTable)
+        self.transpositionTable = transpositionTable
+        self.book = None
+        self.setBook(bookPath, bookDepth)
+        self.tablebase = None
+        self.setTablebase(tablebasePath, tablebasePieces)
+        # Hooks
+        # Anything with is_set(), e.g. a threading.Event; ends the search when set
+        self.stopSignal = None
+        # Called after every finished depth as infoCallback(depth, score, nodes, seconds, pv)
+        self.infoCallback = None
+        self.statsCallback = None  # Called with the SearchStats of every search
+        self.isHelper = False  # Lazy SMP helpers keep deepening until stopped
+        # Move ordering
+        self.killerMoves = [[0, 0] for _ in range(MAX_DEPTH + 1)]
+        self.historyTable = {"w": [0] * 4096, "b": [0] * 4096}  # By moveID & 0xFFF
+        # State of the current search
+        self.evaluate = scorePosition
+        self.nodeCount = 0  # Nodes of both searches, for the limits
+        self.deadline = None
+        self.nodeBudget = None
+        self.rootMove = None  # Best root move of this iteration so far
+        # Result of the last search
+        self.bestMove = None
+        self.bestScore = None
+        self.stats = SearchStats()
+
+    """
+    The settings a helper process needs to search like this one
+    """
+
+    def getSettings(self):
+        return {
+            "depth": self.depth,
+            "deltaMargin": self.deltaMargin,
+            "algorithm": self.algorithm,
+            "nullMovePruning": self.nullMovePruning,
+            "lateMoveReductions": self.lateMoveReductions,
+            "futilityPruning": self.futilityPruning,
+            "reverseFutilityPruning": self.reverseFutilityPruning,
+            "tablebasePath": self.tablebase.directory if self.tablebase else None,
+            "tablebasePieces": (
+                self.tablebase.maxPieces if self.tablebase else TABLEBASE_PIECES
+            ),
+        }
+
+    def setTranspositionTableSize(self, sizeMB, shared=False):
+        self.transpositionTable = TranspositionTable(sizeMB, shared)
+
+    """
+    Play from a Polyglot book for the first bookDepth plies. No path turns the
+    book off
+    """
+
+    def setBook(self, bookPath, bookDepth=BOOK_DEPTH):
+        if self.book is not None:
+            self.book.close()
+        self.book = OpeningBook(bookPath, bookDepth) if bookPath else None
+
+    """
+    Probe Syzygy tablebases in this directory for positions with at most
+    tablebasePieces pieces. No directory turns probing off
+    """
+
+    def setTablebase(self, tablebasePath, tablebasePieces=TABLEBASE_PIECES):
+        if self.tablebase is not None:
+            self.tablebase.close()
+        self.tablebase = (
+            Tablebase(tablebasePath, tablebasePieces) if tablebasePath else None
+        )
+
+    """
+    A move that needs no search: from the opening book, or the tablebases when
+    the position is in them. It is recorded as the result of a search. None
+    when neither knows the position
+    """
+
+    def findKnownMove(self, gs, validMoves):
+        if self.isHelper:
+            return None
+        stats = SearchStats(self.profile)
+        knownMove = None
+        if self.book is not None:
+            knownMove = self.book.pickMove(gs, validMoves)
+            if knownMove is not None:
+                stats.bookMove = knownMove.getChessNotation()
+        if (
+            knownMove is None
+            and self.tablebase is not None
+            and self.tablebase.canProbe(gs)
+        ):
+            knownMove = self.tablebase.findRootMove(gs, validMoves)
+            if knownMove is not None:
+                stats.tablebaseMove = knownMove.getChessNotation()
+        if knownMove is not None:
+            self.stats = stats
+            self.bestMove = knownMove
+            self.bestScore = None
+            if self.statsCallback is not None:
+                self.statsCallback(stats)
+        return knownMove
+
+    """
+    Iterative deepening: search depth 1, 2, 3... until the time (seconds) or
+    node budget runs out, and return the best move of the deepest finished
+    search. Each iteration starts with the previous best move, and the
+    transposition table hands the rest of the previous principal variation
+    back as hash moves
+    """
+
+    def findBestMoveIterative(
+        self,
+        gs,
+        validMoves,
+        timeLimit=None,
+        nodeLimit=None,
+        maxDepth=None,
+        startDepth=1,
+    ):
+        knownMove = self.findKnownMove(gs, validMoves)
+        if knownMove is not None:
+            return knownMove
+        if maxDepth is None:
+            maxDepth = (
+                self.depth if timeLimit is None and nodeLimit is None else MAX_DEPTH
+            )
+        startTime = time.perf_counter()
+        self.deadline = startTime + timeLimit if timeLimit is not None else None
+        self.nodeBudget = nodeLimit
+        moveCount = len(gs.moveLog)
+        random.shuffle(validMoves)
+        self.nodeCount = 0
+        self.clearMoveOrdering()
+        stats = self.stats = SearchStats(self.profile)
+        table = self.transpositionTable
+        tableHits = table.hits
+        tableMisses = table.misses
+        if self.profile:
+            self.startProfiling(gs)
+        bestMove = bestScore = None
+        for depth in range(startDepth, maxDepth + 1):
+            self.rootMove = None
+            try:
+                score = self.findMoveNegaMaxAlphaBeta(
+                    gs,
+                    validMoves,
+                    depth,
+                    -CHECKMATE,
+                    CHECKMATE,
+                    1 if gs.whiteToMove else -1,
+                )
+            except SearchTimeout:
+                while len(gs.moveLog) > moveCount:  # Take back the unfinished line
+                    gs.undoMove()
+                if bestMove is None:
+                    bestMove = self.rootMove
+                break
+            bestMove = self.rootMove
+            bestScore = score
+            stats.addDepth(depth, score, bestMove)
+            if self.infoCallback is not None and bestMove is not None:
+                self.infoCallback(
+                    depth,
+                    score,
+                    self.nodeCount,
+                    time.perf_counter() - startTime,
+                    self.getPrincipalVariation(gs, bestMove, depth),
+                )
+            if bestMove is None or abs(score) >= CHECKMATE:
+                break
+            validMoves.remove(bestMove)
+            validMoves.insert(0, bestMove)
+            # The next iteration takes several times longer, don't start what
+            # can't finish. Helpers keep going: partial results still fill the table
+            if (
+                self.deadline is not None
+                and not self.isHelper
+                and time.perf_counter() - startTime > timeLimit / 2
+            ):
+                break
+        if self.profile:
+            self.stopProfiling(gs)
+        stats.seconds = time.perf_counter() - startTime
+        stats.tableHits = table.hits - tableHits
+        stats.tableProbes = stats.tableHits + table.misses - tableMisses
+        self.bestMove = bestMove
+        self.bestScore = bestScore
+        if self.statsCallback is not None:
+            self.statsCallback(stats)
+        return bestMove
+
+    """
+    Lazy SMP: helper processes run the same iterative deepening search on the
+    same position, sharing the transposition table through shared memory. They
+    don't report moves; what they add is table entries the main search finds as
+    cutoffs and hash moves. Helpers start at different depths and root move
+    orders so they don't all search the same tree in step. workers=1 is the
+    plain search
+    """
+
+    def findBestMoveParallel(
+        self,
+        gs,
+        validMoves,
+        timeLimit=None,
+        nodeLimit=None,
+        maxDepth=None,
+        workers=None,
+    ):
+        if workers is None:
+            workers = self.workers
+        if workers <= 1:
+            return self.findBestMoveIterative(
+                gs, validMoves, timeLimit, nodeLimit, maxDepth
+            )
+        knownMove = self.findKnownMove(gs, validMoves)
+        if knownMove is not None:  # No need to start the helpers
+            return knownMove
+        if not self.transpositionTable.shared:
+            self.setTranspositionTableSize(self.transpositionTable.sizeMB, shared=True)
+        stopEvent = Event()
+        helpers = [
+            Process(
+                target=runHelperSearch,
+                args=(
+                    gs,
+                    list(validMoves),
+                    self.getSettings(),
+                    self.transpositionTable,
+                    stopEvent,
+                    helperNumber,
+                    timeLimit,
+                    nodeLimit,
+                    maxDepth,
+                ),
+                daemon=True,
+            )
+            for helperNumber in range(1, workers)
+        ]
+        for helper in helpers:
+            helper.start()
+        try:
+            bestMove = self.findBestMoveIterative(
+                gs, validMoves, timeLimit, nodeLimit, maxDepth
+            )
+        finally:
+            stopEvent.set()
+            for helper in helpers:
+                helper.join()
+        return bestMove
+
+    """
+    Raise SearchTimeout once the time or node budget is used up, or when
+    stopSignal is set (the main search stopping its helpers, or a cancelled
+    request). Called every 64 nodes
+    """
+
+    def checkSearchLimits(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if self.nodeBudget is not None and self.nodeCount >= self.nodeBudget:
+            raise SearchTimeout()
+        if self.stopSignal is not None and self.stopSignal.is_set():
+            raise SearchTimeout()
+
+    """
+    The line the search expects: the best move, then the hash moves the
+    transposition table holds for the positions after it
+    """
+
+    def getPrincipalVariation(self, gs, bestMove, maxLength=MAX_DEPTH):
+        pv = [bestMove]
+        gs.makeMove(bestMove)
+        while len(pv) < maxLength and not gs.isRepetition(2):
+            entry = self.transpositionTable.probe(gs.zobristKey)
+            if entry is None or not entry[3]:
+                break
+            move = next(gs.generateMoves(entry[3]), None)
+            if move is None or move.moveID != entry[3]:
+                break
+            pv.append(move)
+            gs.makeMove(move)
+        for _ in pv:
+            gs.undoMove()
+        return pv
+
+    """
+    Profiling: shadow the GameState methods and evaluate with timed versions
+    for the length of one search, so searches without profile pay nothing
+    """
+
+    def startProfiling(self, gs):
+        times = self.stats.times
+
+        def timed(function, key):
+            def timedFunction(*args):
+                startTime = time.perf_counter()
+                result = function(*args)
+                times[key] += time.perf_counter() - startTime
+                return result
+
+            return timedFunction
+
+        def timedGenerator(function, key):
+            def timedFunction(*args):
+                moves = function(*args)
+                while True:
+                    startTime = time.perf_counter()
+                    move = next(moves, None)
+                    times[key] += time.perf_counter() - startTime
+                    if move is None:
+                        return
+                    yield move
+
+            return timedFunction
 
-    if whiteToMove:
+        gs.makeMove = timed(gs.makeMove, "makeUndo")
+        gs.undoMove = timed(gs.undoMove, "makeUndo")
+        gs.getValidMoves = timed(gs.getValidMoves, "moveGeneration")
+        gs.getCaptureMoves = timed(gs.getCaptureMoves, "moveGeneration")
+        gs.generateMoves = timedGenerator(gs.generateMoves, "moveGeneration")
+        self.evaluate = timed(scorePosition, "evaluation")
+
+    def stopProfiling(self, gs):
+        for name in (
+            "makeMove",
+            "undoMove",
+            "getValidMoves",
+            "getCaptureMoves",
+            "generateMoves",
+        ):
+            del gs.__dict__[name]
+        self.evaluate = scorePosition
+
+    def findMoveNegaMaxAlphaBeta(
+        self, gs, validMoves, depth, alpha, beta, turnMultiplier, ply=0
+    ):
+        self.nodeCount += 1
+        self.stats.nodes += 1
+        if self.nodeCount & 63 == 0:
+            self.checkSearchLimits()
+        if ply != 0 and gs.isRepetition():
+            return STALEMATE
+        if depth == 0:
+            return self.quiescenceSearch(gs, alpha, beta, turnMultiplier)
+
+        # Transposition table: reuse the result if this position was searched deep enough
+        originalAlpha = alpha
+        entry = self.transpositionTable.probe(gs.zobristKey)
+        if entry is not None:
+            entryDepth, entryScore, entryBound, hashMove = entry
+            entryScore = scoreFromTable(entryScore, ply)
+            if entryDepth >= depth and ply != 0:
+                if entryBound == EXACT:
+                    return entryScore
+                elif entryBound == LOWER_BOUND:
+                    alpha = max(alpha, entryScore)
+                else:
+                    beta = min(beta, entryScore)
+                if alpha >= beta:
+                    return entryScore
+        else:
+            hashMove = 0
+
+        # Tablebases: the exact result, or a bound on it that may cut off
+        tablebase = self.tablebase
+        if (
+            tablebase is not None
+            and ply != 0
+            and gs.halfmoveClock == 0
+            and tablebase.canProbe(gs)
+        ):
+            wdl = tablebase.probeWDL(gs)
+            if wdl is not None:
+                self.stats.tablebaseHits += 1
+                if wdl == 2:
+                    score, bound = TABLEBASE_WIN - ply, LOWER_BOUND
+                elif wdl == -2:
+                    score, bound = -TABLEBASE_WIN + ply, UPPER_BOUND
+                else:  # Draws, and results the fifty move rule draws
+                    score, bound = STALEMATE, EXACT
+                if (
+                    bound == EXACT
+                    or (bound == LOWER_BOUND and score >= beta)
+                    or (bound == UPPER_BOUND and score <= alpha)
+                ):
+                    self.transpositionTable.store(
+                        gs.zobristKey,
+                        MAX_DEPTH,
+                        scoreToTable(score, ply),
+                        bound,
+                        hashMove,
+                    )
+                    return score
+
+        # Selective search, below the root and out of check only
+        selective = (
+            self.nullMovePruning
+            or self.lateMoveReductions
+            or self.futilityPruning
+            or self.reverseFutilityPruning
+        )
+        inCheck = selective and gs.isKingAttacked()
+        futile = False
+        if selective and not inCheck and ply != 0:
+            if (
+                self.nullMovePruning
+                or self.futilityPruning
+                or self.reverseFutilityPruning
+            ):
+                staticScore = turnMultiplier * self.evaluate(gs)
+                # Reverse futility: so far above beta that one or two moves
+                # won't bring the score back down
+                if (
+                    self.reverseFutilityPruning
+                    and depth <= FUTILITY_DEPTH
+                    and abs(beta) < TABLEBASE_WIN
+                    and staticScore - FUTILITY_MARGIN * depth >= beta
+                ):
+                    self.stats.reverseFutilityCutoffs += 1
+                    return staticScore
+                # Null move: if passing still fails high after a reduced
+                # search, a real move will too. Not when passing may be the
+                # best there is (only pawns left), nor twice in a row
+                if (
+                    self.nullMovePruning
+                    and depth >= NULL_MOVE_DEPTH
+                    and staticScore >= beta
+                    and abs(beta) < TABLEBASE_WIN
+                    and gs.moveLog
+                    and gs.moveLog[-1] is not None
+                    and gs.hasNonPawnMaterial()
+                ):
+                    reduction = NULL_MOVE_REDUCTION + (depth >= 6)
+                    gs.makeNullMove()
+                    score = -self.findMoveNegaMaxAlphaBeta(
+                        gs,
+                        None,
+                        depth - 1 - reduction,
+                        -beta,
+                        -beta + 1,
+                        -turnMultiplier,
+                        ply + 1,
+                    )
+                    gs.undoMove()
+                    if score >= beta:
+                        self.stats.nullMoveCutoffs += 1
+                        return beta if score >= TABLEBASE_WIN else score
+                # Futility: so far below alpha that a quiet move won't lift it
+                futile = (
+                    self.futilityPruning
+                    and depth <= FUTILITY_DEPTH
+                    and abs(alpha) < TABLEBASE_WIN
+                    and staticScore + FUTILITY_MARGIN * depth <= alpha
+                )
+
+        # Move ordering... Evaluate best moves first... We prune out worse branches
         maxScore = -CHECKMATE
-        for move in validMoves:
+        bestMove = None
+        if validMoves is None:  # Generate in stages, stopping at a cutoff
+            moves = gs.generateMoves(
+                hashMove,
+                lambda stageMoves: pickMoves(
+                    stageMoves, self.scoreMoves(stageMoves, 0, ply)
+                ),
+            )
+        else:
+            moves = pickMoves(validMoves, self.scoreMoves(validMoves, hashMove, ply))
+        principalVariation = self.algorithm == PRINCIPAL_VARIATION
+        reduceLateMoves = (
+            self.lateMoveReductions and depth >= LATE_MOVE_DEPTH and not inCheck
+        )
+        killers = self.killerMoves[ply]
+        for moveNumber, move in enumerate(moves):
+            quiet = not move.isCapture and not move.pawnPromotion
             gs.makeMove(move)
-            nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth - 1, False)
-            if score > maxScore:
+            # The first move is always searched, so a node never looks lost
+            # for want of moves; neither are checks pruned or reduced
+            if (
+                quiet
+                and moveNumber > 0
+                and (futile or reduceLateMoves and moveNumber >= LATE_MOVE_NUMBER)
+                and not gs.isKingAttacked()
+            ):
+                if futile:
+                    gs.undoMove()
+                    self.stats.futilityPrunes += 1
+                    continue
+                # Late move reductions: a quiet move this far down the order is
+                # rarely best, so search it less deep first (one ply less again
+                # from move 6, one ply more if it caused cutoffs elsewhere)
+                reduction = 1 + (moveNumber >= 2 * LATE_MOVE_NUMBER)
+                if self.historyTable[move.pieceMoved[0]][move.moveID & 0xFFF] > 0:
+                    reduction -= 1
+                if reduction and move.moveID not in killers:
+                    self.stats.reductions += 1
+                    score = -self.findMoveNegaMaxAlphaBeta(
+                        gs,
+                        None,
+                        depth - 1 - reduction,
+                        -alpha - 1,
+                        -alpha,
+                        -turnMultiplier,
+                        ply + 1,
+                    )
+                    if score <= alpha:  # Fails low as expected: no full search
+                        if score > maxScore:
+                            maxScore = score
+                            bestMove = move
+                        gs.undoMove()
+                        continue
+            if moveNumber == 0 or not principalVariation:
+                score = -self.findMoveNegaMaxAlphaBeta(
+                    gs, None, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1
+                )
+            else:
+                # PVS: with good ordering the first move stays best, and a null
+                # window around alpha proves that more cheaply. Only a move
+                # that turns out better is searched again with the full window
+                score = -self.findMoveNegaMaxAlphaBeta(
+                    gs, None, depth - 1, -alpha - 1, -alpha, -turnMultiplier, ply + 1
+                )
+                if alpha < score < beta:
+                    self.stats.researches += 1
+                    score = -self.findMoveNegaMaxAlphaBeta(
+                        gs, None, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1
+                    )
+            if score > maxScore or bestMove is None:
                 maxScore = score
-                if depth == DEPTH:
-                    nextMove = move
+                bestMove = move
+                if ply == 0:
+                    self.rootMove = move
             gs.undoMove()
+            if maxScore > alpha:  # Pruning
+                alpha = maxScore
+            if alpha >= beta:
+                self.stats.betaCutoffs += 1
+                if moveNumber == 0:
+                    self.stats.firstMoveCutoffs += 1
+                if not move.isCapture:
+                    self.storeKillerMove(move, ply)
+                    self.historyTable[move.pieceMoved[0]][move.moveID & 0xFFF] += (
+                        depth * depth
+                    )
+                break
+        if bestMove is None:  # No legal moves
+            return -CHECKMATE if gs.inCheck else STALEMATE
+
+        if maxScore <= originalAlpha:
+            bound = UPPER_BOUND
+        elif maxScore >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.transpositionTable.store(
+            gs.zobristKey,
+            depth,
+            scoreToTable(maxScore, ply),
+            bound,
+            bestMove.moveID,
+        )
         return maxScore
-    else:
-        minScore = CHECKMATE
-        for move in validMoves:
+
+    """
+    Quiescence search
+    At the end of the main search keep playing captures and promotions until
+    the position is quiet, so the evaluation never sees a piece left hanging mid
+    exchange. The side to move may always "stand pat" on the static score
+    instead of capturing, unless it is in check
+    """
+
+    def quiescenceSearch(self, gs, alpha, beta, turnMultiplier):
+        self.nodeCount += 1
+        self.stats.qnodes += 1
+        if self.nodeCount & 63 == 0:
+            self.checkSearchLimits()
+
+        moves = gs.getCaptureMoves()
+        inCheck = gs.inCheck
+        if inCheck:  # Every evasion has to be looked at, not only captures
+            moves = gs.getValidMoves()
+            if gs.checkMate:
+                return -CHECKMATE
+            standPat = -CHECKMATE
+        else:
+            standPat = turnMultiplier * self.evaluate(gs)
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+
+        maxScore = standPat
+        for move in pickMoves(moves, self.scoreMoves(moves, 0, 0)):
+            # Delta pruning: skip captures that can't raise alpha even with a margin
+            if (
+                not inCheck
+                and not move.pawnPromotion
+                and standPat + PIECE_VALUES[move.pieceCaptured[1]] + self.deltaMargin
+                <= alpha
+            ):
+                continue
             gs.makeMove(move)
-            nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth - 1, True)
-            if score < minScore:
-                minScore = score
-                if depth == DEPTH:
-                    nextMove = move
+            score = -self.quiescenceSearch(gs, -beta, -alpha, -turnMultiplier)
             gs.undoMove()
-        return minScore
-
-
-def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
-    global nextMove
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-
-    maxScore = -CHECKMATE
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMove = gs.getValidMoves()
-        score = -findMoveNegaMax(gs, nextMove, depth - 1, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-        gs.undoMove(move)
-
-    return maxScore
-
-
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-
-    # Move ordering... Evaluate best moves first... We prune out worse branches
-    maxScore = -CHECKMATE
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(
-            gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier
-        )
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-        gs.undoMove()
-        if maxScore > alpha:  # Pruning
-            alpha = maxScore
-        if alpha >= beta:
-            break
-    return maxScore
+            if score > maxScore:
+                maxScore = score
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    break
+        return maxScore
+
+    """
+    Move ordering
+    Hash move first, then captures by MVV-LVA (most valuable victim, least
+    valuable attacker), promotions, the two killer moves of this ply and finally
+    quiet moves by how often they caused cutoffs before (history heuristic)
+    """
+
+    def scoreMoves(self, moves, hashMove, ply):
+        killers = self.killerMoves[ply]
+        historyTable = self.historyTable
+        scores = []
+        for move in moves:
+            moveID = move.moveID
+            if moveID == hashMove:
+                scores.append(HASH_MOVE_SCORE)
+            elif move.isCapture:
+                scores.append(
+                    CAPTURE_SCORE
+                    + victimValues[move.pieceCaptured[1]]
+                    - attackerValues[move.pieceMoved[1]]
+                )
+            elif move.pawnPromotion:
+                scores.append(PROMOTION_SCORE)
+            elif moveID == killers[0]:
+                scores.append(KILLER_SCORES[0])
+            elif moveID == killers[1]:
+                scores.append(KILLER_SCORES[1])
+            else:
+                scores.append(historyTable[move.pieceMoved[0]][move.moveID & 0xFFF])
+        return scores
+
+    def storeKillerMove(self, move, ply):
+        killers = self.killerMoves[ply]
+        if killers[0] != move.moveID:
+            killers[1] = killers[0]
+            killers[0] = move.moveID
+
+    def clearMoveOrdering(self):
+        for killers in self.killerMoves:
+            killers[0] = killers[1] = 0
+        for color in self.historyTable:
+            self.historyTable[color] = [0] * 4096
+
+
+"""
+Lazy SMP helper process: a Searcher of its own on the shared table
+"""
+
+
+def runHelperSearch(
+    gs,
+    validMoves,
+    settings,
+    table,
+    stopEvent,
+    helperNumber,
+    timeLimit,
+    nodeLimit,
+    maxDepth,
+):
+    searcher = Searcher(transpositionTable=table, **settings)
+    searcher.stopSignal = stopEvent
+    searcher.isHelper = True
+    random.seed(helperNumber)
+    searcher.findBestMoveIterative(
+        gs, validMoves, timeLimit, nodeLimit, maxDepth, 1 + helperNumber % 2
+    )
+
+
+"""
+Tablebase scores count plies from the root (a quicker win scores higher), but
+the table is shared by every path to a position. It holds them counted from
+the position itself instead, and they are turned back on the way out
+"""
+
+
+def scoreToTable(score, ply):
+    if TABLEBASE_WIN - MAX_DEPTH <= score <= TABLEBASE_WIN:
+        return score + ply
+    if -TABLEBASE_WIN <= score <= -TABLEBASE_WIN + MAX_DEPTH:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if TABLEBASE_WIN - MAX_DEPTH <= score <= TABLEBASE_WIN:
+        return score - ply
+    if -TABLEBASE_WIN <= score <= -TABLEBASE_WIN + MAX_DEPTH:
+        return score + ply
+    return score
+
+
+"""
+Lazy selection sort: only find the next best move when the search asks for it,
+so moves after a cutoff are never sorted
+"""
+
+
+def pickMoves(moves, scores):
+    for i in range(len(moves)):
+        best = i
+        for j in range(i + 1, len(moves)):
+            if scores[j] > scores[best]:
+                best = j
+        if best != i:
+            moves[i], moves[best] = moves[best], moves[i]
+            scores[i], scores[best] = scores[best], scores[i]
+        yield moves[i]
 
 
 """
@@ -221,24 +993,22 @@ def scoreBoard(gs):
             return CHECKMATE
     elif gs.staleMate or gs.drawByRepetition:
         return STALEMATE
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square != "--":
-                # Score it positionally
-                piecePositionScore = 0
-                if square[1] != "K":
-                    if square[1] == "p":
-                        piecePositionScore = piecePositionScores[square][row][col]
-                    else:
-                        piecePositionScore = piecePositionScores[square[1]][row][col]
-                if square[0] == "w":
-                    score += pieceScores[square[1]] + piecePositionScore * 0.1
-                elif square[0] == "b":
-                    score -= pieceScores[square[1]] + piecePositionScore * 0.1
+    return scorePosition(gs)
 
-    return score
+
+"""
+Material and piece placement only, without looking for mate or stalemate
+GameState keeps this score up to date move by move, so this is O(1)
+"""
+
+
+def scorePosition(gs):
+    if DEBUG_EVALUATION:
+        fullScore = computeBoardScore(gs.board)
+        assert gs.boardScore == fullScore, (
+            "Incremental score " + str(gs.boardScore) + " != full " + str(fullScore)
+        )
+    return gs.boardScore
 
 
 """
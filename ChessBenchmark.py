@@ -0,0 +1,137 @@
+"""
+Search benchmark on a fixed set of positions
+- Parallel search: time to finish a fixed depth search for each worker count,
+  and the speedup over the first count listed
+- Search algorithms: nodes to finish a fixed depth search with each algorithm,
+  and the nodes saved against the first one listed
+
+Usage:
+    python ChessBenchmark.py                         1, 2, 4... up to the core count
+    python ChessBenchmark.py --workers 1 2 8 --depth 4
+    python ChessBenchmark.py --workers 1 --stats    Search statistics as JSON lines
+    python ChessBenchmark.py --algorithms alphabeta pvs --depth 5
+"""
+
+import argparse
+import os
+import random
+import time
+
+import ChessAI
+import ChessEngine
+
+BENCHMARK_POSITIONS = [
+    ChessEngine.STARTING_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPP1/R4RK1 w - - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+"""
+Seconds to search every benchmark position to depth with the given workers.
+The table is cleared before each position so every run starts cold
+"""
+
+
+def timeToDepth(searcher, depth, workers, printStats=False):
+    seconds = 0.0
+    for fen in BENCHMARK_POSITIONS:
+        gs = ChessEngine.GameState.fromFEN(fen)
+        searcher.transpositionTable.clear()
+        random.seed(0)
+        startTime = time.perf_counter()
+        searcher.findBestMoveParallel(
+            gs, gs.getValidMoves(), maxDepth=depth, workers=workers
+        )
+        seconds += time.perf_counter() - startTime
+        if printStats:
+            print(searcher.stats.toJSON())
+    return seconds
+
+
+"""
+Nodes (main and quiescence search) and seconds to search every benchmark
+position to depth in this process, from a cold table
+"""
+
+
+def nodesToDepth(searcher, depth, printStats=False):
+    nodes = 0
+    seconds = 0.0
+    for fen in BENCHMARK_POSITIONS:
+        gs = ChessEngine.GameState.fromFEN(fen)
+        searcher.transpositionTable.clear()
+        random.seed(0)
+        startTime = time.perf_counter()
+        searcher.findBestMoveIterative(gs, gs.getValidMoves(), maxDepth=depth)
+        seconds += time.perf_counter() - startTime
+        nodes += searcher.stats.nodes + searcher.stats.qnodes
+        if printStats:
+            print(searcher.stats.toJSON())
+    return nodes, seconds
+
+
+def compareAlgorithms(algorithms, depth, printStats=False):
+    print("depth " + str(depth))
+    baseline = None
+    for algorithm in algorithms:
+        searcher = ChessAI.Searcher(algorithm=algorithm, profile=printStats)
+        nodes, seconds = nodesToDepth(searcher, depth, printStats)
+        if baseline is None:
+            baseline = nodes
+        print(
+            algorithm
+            + "  nodes "
+            + str(nodes)
+            + "  time "
+            + format(seconds, ".2f")
+            + "s  nodes saved "
+            + format(100 * (1 - nodes / baseline), ".1f")
+            + "%"
+        )
+
+
+def main():
+    cores = os.cpu_count() or 1
+    defaultWorkers = [1]
+    while defaultWorkers[-1] * 2 <= cores:
+        defaultWorkers.append(defaultWorkers[-1] * 2)
+    parser = argparse.ArgumentParser(description="Lazy SMP speedup per worker count")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="+", default=defaultWorkers)
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print each search's statistics as JSON, with timings (slower)",
+    )
+    parser.add_argument(
+        "--algorithms",
+        nargs="+",
+        choices=ChessAI.SEARCH_ALGORITHMS,
+        help="Compare node counts of these search algorithms instead",
+    )
+    args = parser.parse_args()
+    if args.algorithms:
+        compareAlgorithms(args.algorithms, args.depth, args.stats)
+        return 0
+    # The same shared table for every run, so only the worker count changes
+    searcher = ChessAI.Searcher(sharedTable=True, profile=args.stats)
+    print("cores " + str(cores) + "  depth " + str(args.depth))
+    baseline = None
+    for workers in args.workers:
+        seconds = timeToDepth(searcher, args.depth, workers, args.stats)
+        if baseline is None:
+            baseline = seconds
+        print(
+            "workers "
+            + str(workers)
+            + "  time "
+            + format(seconds, ".2f")
+            + "s  speedup "
+            + format(baseline / seconds, ".2f")
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,205 @@
+"""
+Bitboard tables and attack generation
+- A square is indexed as row * 8 + col, so square 0 is a8 and square 63 is h1
+  (the same orientation as GameState.board)
+- Every table is built once at import time
+"""
+
+FULL_BOARD = (1 << 64) - 1
+FILE_A = sum(1 << (row * 8) for row in range(8))
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL_BOARD ^ FILE_A
+NOT_FILE_H = FULL_BOARD ^ FILE_H
+ROW_MASKS = [0xFF << (row * 8) for row in range(8)]
+
+# Directions as (row step, col step). The first four walk towards higher
+# square indexes, the last four towards lower ones.
+NORTH, SOUTH, WEST, EAST = (-1, 0), (1, 0), (0, -1), (0, 1)
+NORTH_WEST, NORTH_EAST, SOUTH_WEST, SOUTH_EAST = (-1, -1), (-1, 1), (1, -1), (1, 1)
+DIRECTIONS = (SOUTH, EAST, SOUTH_WEST, SOUTH_EAST, NORTH, WEST, NORTH_WEST, NORTH_EAST)
+
+
+def squareBit(r, c):
+    return 1 << (r * 8 + c)
+
+
+def iterateBits(bitboard):
+    while bitboard:
+        lowBit = bitboard & -bitboard
+        yield lowBit.bit_length() - 1
+        bitboard ^= lowBit
+
+
+def popCount(bitboard):
+    return bin(bitboard).count("1")
+
+
+def leaperTable(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                attacks |= squareBit(r + dr, c + dc)
+        table.append(attacks)
+    return table
+
+
+def rayTable(direction):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        ray = 0
+        for i in range(1, 8):
+            endRow = r + direction[0] * i
+            endCol = c + direction[1] * i
+            if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                break
+            ray |= squareBit(endRow, endCol)
+        table.append(ray)
+    return table
+
+
+KNIGHT_ATTACKS = leaperTable(
+    ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+)
+KING_ATTACKS = leaperTable(
+    ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+)
+# Squares attacked by a pawn of the given colour standing on a square
+PAWN_ATTACKS = {
+    "w": leaperTable(((-1, -1), (-1, 1))),
+    "b": leaperTable(((1, -1), (1, 1))),
+}
+
+RAYS = {d: rayTable(d) for d in DIRECTIONS}
+
+# BETWEEN[a][b]: squares strictly between two aligned squares, 0 otherwise
+# LINE[a][b]: the whole line through two aligned squares, 0 otherwise
+BETWEEN = [[0] * 64 for _ in range(64)]
+LINE = [[0] * 64 for _ in range(64)]
+for sq in range(64):
+    for d in DIRECTIONS:
+        ray = RAYS[d][sq]
+        line = ray | RAYS[(-d[0], -d[1])][sq] | (1 << sq)
+        for target in iterateBits(ray):
+            BETWEEN[sq][target] = ray ^ RAYS[d][target] ^ (1 << target)
+            LINE[sq][target] = line
+
+
+"""
+Sliding attacks by lookup, kindergarten style: the attacks along one line
+through a square depend only on which of the line's inner squares are occupied
+(the last square on each side is attacked whatever stands on it). So every
+square has a table per line, keyed by those at most 6 occupancy bits, and a
+rook is a file lookup plus a rank lookup. Kindergarten bitboards gather the
+bits into an index with a multiplication; in Python a dict keyed by the masked
+occupancy does the same job faster. 4 lines x 64 squares x at most 64 entries
+"""
+
+
+def subsets(mask):
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask  # Next subset, in counting order
+        if not subset:
+            return
+
+
+def lineTables(directions):
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = 0
+        for d in directions:
+            ray = RAYS[d][sq]
+            if ray:  # Leave out the edge square, the furthest one along the ray
+                if d in DIRECTIONS[:4]:
+                    mask |= ray ^ (1 << (ray.bit_length() - 1))
+                else:
+                    mask |= ray ^ (ray & -ray)
+        table = {}
+        for occupied in subsets(mask):
+            attacks = 0
+            for d in directions:
+                ray = RAYS[d][sq]
+                blockers = ray & occupied
+                if blockers:  # Cut the ray off behind the nearest blocker
+                    if d in DIRECTIONS[:4]:
+                        ray ^= RAYS[d][(blockers & -blockers).bit_length() - 1]
+                    else:
+                        ray ^= RAYS[d][blockers.bit_length() - 1]
+                attacks |= ray
+            table[occupied] = attacks
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+FILE_MASKS, FILE_ATTACKS = lineTables((NORTH, SOUTH))
+RANK_MASKS, RANK_ATTACKS = lineTables((WEST, EAST))
+DIAGONAL_MASKS, DIAGONAL_ATTACKS = lineTables((SOUTH_WEST, NORTH_EAST))
+ANTI_DIAGONAL_MASKS, ANTI_DIAGONAL_ATTACKS = lineTables((SOUTH_EAST, NORTH_WEST))
+
+
+def rookAttacks(sq, occupied):
+    return (
+        FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]]
+        | RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]]
+    )
+
+
+def bishopAttacks(sq, occupied):
+    return (
+        DIAGONAL_ATTACKS[sq][occupied & DIAGONAL_MASKS[sq]]
+        | ANTI_DIAGONAL_ATTACKS[sq][occupied & ANTI_DIAGONAL_MASKS[sq]]
+    )
+
+
+def queenAttacks(sq, occupied):
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+
+
+def pawnAttacks(pawns, color):
+    if color == "w":
+        return ((pawns & NOT_FILE_A) >> 9) | ((pawns & NOT_FILE_H) >> 7)
+    return ((pawns & NOT_FILE_A) << 7) | ((pawns & NOT_FILE_H) << 9)
+
+
+"""
+All squares attacked by the pieces of one colour
+"""
+
+
+def attackedSquares(bitboards, color, occupied):
+    attacks = pawnAttacks(bitboards[color + "p"], color)
+    for sq in iterateBits(bitboards[color + "N"]):
+        attacks |= KNIGHT_ATTACKS[sq]
+    queens = bitboards[color + "Q"]
+    for sq in iterateBits(bitboards[color + "R"] | queens):
+        attacks |= rookAttacks(sq, occupied)
+    for sq in iterateBits(bitboards[color + "B"] | queens):
+        attacks |= bishopAttacks(sq, occupied)
+    king = bitboards[color + "K"]
+    if king:
+        attacks |= KING_ATTACKS[king.bit_length() - 1]
+    return attacks
+
+
+"""
+Pieces of one colour attacking a square
+"""
+
+
+def attackersTo(bitboards, sq, color, occupied):
+    enemy = "b" if color == "w" else "w"
+    queens = bitboards[color + "Q"]
+    return (
+        (KNIGHT_ATTACKS[sq] & bitboards[color + "N"])
+        | (PAWN_ATTACKS[enemy][sq] & bitboards[color + "p"])
+        | (KING_ATTACKS[sq] & bitboards[color + "K"])
+        | (rookAttacks(sq, occupied) & (bitboards[color + "R"] | queens))
+        | (bishopAttacks(sq, occupied) & (bitboards[color + "B"] | queens))
+    )
@@ -4,8 +4,136 @@ Storing all the information about the current state of a chess game
 - Keep a move log
 """
 
+import random
+
+from ChessBitboard import (
+    BETWEEN,
+    FULL_BOARD,
+    KING_ATTACKS,
+    KNIGHT_ATTACKS,
+    LINE,
+    NOT_FILE_A,
+    NOT_FILE_H,
+    PAWN_ATTACKS,
+    ROW_MASKS,
+    attackedSquares,
+    attackersTo,
+    bishopAttacks,
+    iterateBits,
+    queenAttacks,
+    rookAttacks,
+    squareBit,
+)
+from ChessEvaluation import PIECE_SQUARE_SCORES, computeBoardScore
+
+PROMOTION_PIECES = ("Q", "R", "B", "N")
+# Move generation stages
+ALL_MOVES = 0
+CAPTURE_MOVES = 1  # Captures and promotions
+QUIET_MOVES = 2  # Everything else
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+fenToPiece = {
+    char: ("w" if char.isupper() else "b") + ("p" if char in "pP" else char.upper())
+    for char in "pPrRnNbBqQkK"
+}
+pieceToFen = {v: k for k, v in fenToPiece.items()}
+
+"""
+Zobrist keys: one random 64 bit number per (piece, square), side to move,
+castling rights combination and en passant file. A position's key is the XOR
+of the numbers for everything in it. Seeded so keys are stable between runs
+"""
+zobristRandom = random.Random(20211113)
+ZOBRIST_PIECES = {
+    color + piece: [zobristRandom.getrandbits(64) for _ in range(64)]
+    for color in "wb"
+    for piece in ("p", "R", "N", "B", "Q", "K")
+}
+ZOBRIST_BLACK_TO_MOVE = zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [zobristRandom.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [zobristRandom.getrandbits(64) for _ in range(8)]
+
+# Castling rights as a 4 bit mask
+WHITE_KINGSIDE = 1
+BLACK_KINGSIDE = 2
+WHITE_QUEENSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING_RIGHTS = 15
+# Rights that survive a move from or to each square: moving the king or a rook,
+# or capturing a rook on its corner, loses the matching rights for good
+CASTLING_RIGHTS_KEPT = [ALL_CASTLING_RIGHTS] * 64
+CASTLING_RIGHTS_KEPT[0] = ALL_CASTLING_RIGHTS ^ BLACK_QUEENSIDE  # a8
+CASTLING_RIGHTS_KEPT[4] = ALL_CASTLING_RIGHTS ^ BLACK_KINGSIDE ^ BLACK_QUEENSIDE
+CASTLING_RIGHTS_KEPT[7] = ALL_CASTLING_RIGHTS ^ BLACK_KINGSIDE  # h8
+CASTLING_RIGHTS_KEPT[56] = ALL_CASTLING_RIGHTS ^ WHITE_QUEENSIDE  # a1
+CASTLING_RIGHTS_KEPT[60] = ALL_CASTLING_RIGHTS ^ WHITE_KINGSIDE ^ WHITE_QUEENSIDE
+CASTLING_RIGHTS_KEPT[63] = ALL_CASTLING_RIGHTS ^ WHITE_KINGSIDE  # h1
+
+"""
+Board scan tables, made once at import so the generators don't bounds check
+or loop over step tuples. Indexed by square (row * 8 + col), they hold target
+squares as (row, col):
+- RAYS: the squares in each of the 8 KING_STEPS directions, nearest first,
+  out to the edge. Rays 0-3 are orthogonal, 4-7 diagonal
+- KNIGHT_TARGETS, KING_TARGETS: the squares a knight or king reaches
+- PAWN_PUSHES, PAWN_CAPTURES: per color, the one and (from the starting row)
+  two square pushes, and the two diagonal captures
+"""
+KING_STEPS = (
+    (-1, 0),
+    (0, -1),
+    (1, 0),
+    (0, 1),
+    (-1, -1),
+    (-1, 1),
+    (1, -1),
+    (1, 1),
+)
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+
+def onBoardTargets(r, c, steps):
+    return tuple(
+        (r + dr, c + dc) for dr, dc in steps if 0 <= r + dr < 8 and 0 <= c + dc < 8
+    )
+
+
+RAYS = [
+    tuple(
+        onBoardTargets(r, c, [(dr * i, dc * i) for i in range(1, 8)])
+        for dr, dc in KING_STEPS
+    )
+    for r in range(8)
+    for c in range(8)
+]
+KNIGHT_TARGETS = [
+    onBoardTargets(r, c, KNIGHT_STEPS) for r in range(8) for c in range(8)
+]
+KING_TARGETS = [onBoardTargets(r, c, KING_STEPS) for r in range(8) for c in range(8)]
+PAWN_PUSHES = {
+    "w": [
+        onBoardTargets(r, c, [(-1, 0)] + [(-2, 0)] * (r == 6))
+        for r in range(8)
+        for c in range(8)
+    ],
+    "b": [
+        onBoardTargets(r, c, [(1, 0)] + [(2, 0)] * (r == 1))
+        for r in range(8)
+        for c in range(8)
+    ],
+}
+PAWN_CAPTURES = {
+    "w": [
+        onBoardTargets(r, c, ((-1, -1), (-1, 1))) for r in range(8) for c in range(8)
+    ],
+    "b": [onBoardTargets(r, c, ((1, -1), (1, 1))) for r in range(8) for c in range(8)],
+}
+
 
 class GameState:
+    # Generate moves from the bitboards; False falls back to the board scan
+    useBitboards = True
+
     def __init__(self):
         # Board is an 8x8 2 dimensional list
         # Each element has two characters: Color of piece(b,w) + Type of piece(K, Q, R, B, N, p)
@@ -29,30 +157,332 @@ class GameState:
             "K": self.getKingMoves,
         }
         self.whiteToMove = True
+        self.startFEN = STARTING_FEN  # Position before the first move in moveLog
         self.moveLog = []
         self.whiteKingLocation = (7, 4)
         self.blackKingLocation = (0, 4)
         self.inCheck = False
-        self.pins = []
+        self.pinDirections = {}  # Pinned square -> direction from the king
         self.checks = []
+        self.attackMap = bytearray(64)  # Squares the side not to move attacks
         self.checkMate = False
         self.staleMate = False
         self.drawByRepetition = False
         self.enPassantPossible = ()  # Square where en passant can happen
-        self.enPassantPossibleLog = [self.enPassantPossible]
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castlingRightsLog = [
-            CastleRights(
-                self.currentCastlingRight.wks,
-                self.currentCastlingRight.bks,
-                self.currentCastlingRight.wqs,
-                self.currentCastlingRight.bqs,
+        self.castlingRights = ALL_CASTLING_RIGHTS
+        self.halfmoveClock = 0  # Moves since the last capture or pawn move
+        self.fullmoveNumber = 1
+        # What undoMove can't work out from the move itself, one tuple per move:
+        # (castlingRights, enPassantPossible, halfmoveClock, zobristKey, scoreDelta)
+        self.stateLog = []
+        self.computeBitboards()
+        self.zobristKey = self.computeZobristKey()
+        self.boardScore = computeBoardScore(self.board)  # Centipawns, + good for white
+
+    """
+    FEN (Forsyth-Edwards Notation): the whole position in one line of text
+    e.g. "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+    """
+
+    @classmethod
+    def fromFEN(cls, fen):
+        gs = cls()
+        gs.loadFEN(fen)
+        return gs
+
+    def loadFEN(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        # Parse everything before changing the state, so a bad FEN leaves the
+        # position as it was
+        board = []
+        kingLocations = {}
+        for r, rankText in enumerate(fields[0].split("/")):
+            row = []
+            for char in rankText:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                elif char in fenToPiece:
+                    if char in "Kk":
+                        if char in kingLocations:
+                            raise ValueError("FEN has two " + char + " kings: " + fen)
+                        kingLocations[char] = (r, len(row))
+                    row.append(fenToPiece[char])
+                else:
+                    raise ValueError("Bad piece in FEN: " + char)
+            if len(row) != 8:
+                raise ValueError("Bad rank in FEN: " + rankText)
+            board.append(row)
+        if len(board) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fields[0])
+        if len(kingLocations) != 2:
+            raise ValueError("FEN needs one king of each color: " + fields[0])
+        if fields[1] not in ("w", "b"):
+            raise ValueError("Bad side to move in FEN: " + fields[1])
+        if any(square[1] == "p" for square in board[0] + board[7]):
+            raise ValueError("FEN has a pawn on the first or last rank: " + fields[0])
+        # The side that just moved can't have left its king in check
+        bitboards = {piece: 0 for piece in fenToPiece.values()}
+        occupied = 0
+        for r, row in enumerate(board):
+            for c, square in enumerate(row):
+                if square != "--":
+                    bitboards[square] |= squareBit(r, c)
+                    occupied |= squareBit(r, c)
+        waitingKing = kingLocations["k" if fields[1] == "w" else "K"]
+        if attackersTo(
+            bitboards, waitingKing[0] * 8 + waitingKing[1], fields[1], occupied
+        ):
+            raise ValueError("FEN has the side not to move in check: " + fen)
+        # A right only counts with the king and that rook still at home
+        castlingRights = 0
+        for char, right, homes in (
+            ("K", WHITE_KINGSIDE, ((7, 4, "wK"), (7, 7, "wR"))),
+            ("k", BLACK_KINGSIDE, ((0, 4, "bK"), (0, 7, "bR"))),
+            ("Q", WHITE_QUEENSIDE, ((7, 4, "wK"), (7, 0, "wR"))),
+            ("q", BLACK_QUEENSIDE, ((0, 4, "bK"), (0, 0, "bR"))),
+        ):
+            if char in fields[2] and all(board[r][c] == piece for r, c, piece in homes):
+                castlingRights |= right
+        if fields[3] == "-":
+            enPassantPossible = ()
+        elif (
+            len(fields[3]) == 2
+            and fields[3][0] in Move.filestoCols
+            and fields[3][1] in ("3", "6")
+        ):
+            enPassantPossible = (
+                Move.ranksToRows[fields[3][1]],
+                Move.filestoCols[fields[3][0]],
             )
-        ]
+        else:
+            raise ValueError("Bad en passant square in FEN: " + fields[3])
+        halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        self.board = board
+        self.whiteKingLocation = kingLocations["K"]
+        self.blackKingLocation = kingLocations["k"]
+        self.whiteToMove = fields[1] == "w"
+        self.castlingRights = castlingRights
+        self.enPassantPossible = enPassantPossible
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+        self.startFEN = fen
+        self.moveLog = []
+        self.stateLog = []
+        self.checkMate = self.staleMate = self.drawByRepetition = False
+        self.computeBitboards()
+        self.zobristKey = self.computeZobristKey()
+        self.boardScore = computeBoardScore(self.board)
+
+    def toFEN(self):
+        ranks = []
+        for row in self.board:
+            rankText = ""
+            empty = 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                else:
+                    if empty:
+                        rankText += str(empty)
+                        empty = 0
+                    rankText += pieceToFen[square]
+            if empty:
+                rankText += str(empty)
+            ranks.append(rankText)
+        rights = self.castlingRights
+        castling = (
+            ("K" if rights & WHITE_KINGSIDE else "")
+            + ("Q" if rights & WHITE_QUEENSIDE else "")
+            + ("k" if rights & BLACK_KINGSIDE else "")
+            + ("q" if rights & BLACK_QUEENSIDE else "")
+        )
+        if self.enPassantPossible == ():
+            enPassant = "-"
+        else:
+            enPassant = (
+                Move.colsToFiles[self.enPassantPossible[1]]
+                + Move.rowsToRanks[self.enPassantPossible[0]]
+            )
+        return " ".join(
+            (
+                "/".join(ranks),
+                "w" if self.whiteToMove else "b",
+                castling or "-",
+                enPassant,
+                str(self.halfmoveClock),
+                str(self.fullmoveNumber),
+            )
+        )
+
+    """
+    Standard algebraic notation (SAN) for a legal move in this position, as
+    used in PGN: piece letter, file/rank only when needed to tell two pieces
+    apart, "+" for check and "#" for mate. Plays the move to see if it checks,
+    so the checkMate/staleMate flags are cleared afterwards
+    """
+
+    def getSAN(self, move, validMoves=None):
+        if validMoves is None:
+            validMoves = self.getValidMoves()
+        if move.castle:
+            san = "O-O" if move.endCol > move.startCol else "O-O-O"
+        elif move.pieceMoved[1] == "p":
+            san = move.getRankFile(move.endRow, move.endCol)
+            if move.isCapture:
+                san = Move.colsToFiles[move.startCol] + "x" + san
+            if move.pawnPromotion:
+                san += "=" + move.promotionPiece
+        else:
+            san = move.pieceMoved[1]
+            rivals = [
+                other
+                for other in validMoves
+                if other.pieceMoved == move.pieceMoved
+                and other.endRow == move.endRow
+                and other.endCol == move.endCol
+                and other.moveID != move.moveID
+            ]
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    san += Move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    san += Move.rowsToRanks[move.startRow]
+                else:
+                    san += move.getRankFile(move.startRow, move.startCol)
+            if move.isCapture:
+                san += "x"
+            san += move.getRankFile(move.endRow, move.endCol)
+        self.makeMove(move)
+        self.getValidMoves()
+        if self.checkMate:
+            san += "#"
+        elif self.inCheck:
+            san += "+"
+        self.undoMove()
+        return san
+
+    """
+    Rebuild the bitboards from the board
+    One 64 bit integer per piece, plus one occupancy integer per colour
+    """
+
+    def computeBitboards(self):
+        self.bitboards = {
+            color + piece: 0
+            for color in "wb"
+            for piece in ("p", "R", "N", "B", "Q", "K")
+        }
+        self.occupancy = {"w": 0, "b": 0}
+        for r in range(8):
+            for c in range(8):
+                square = self.board[r][c]
+                if square != "--":
+                    self.bitboards[square] |= squareBit(r, c)
+                    self.occupancy[square[0]] |= squareBit(r, c)
+
+    """
+    Apply a move to the bitboards. Every update is an XOR, so calling this
+    again with the same move takes it back
+    """
+
+    def updateBitboards(self, move):
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        color = move.pieceMoved[0]
+        startBit = squareBit(move.startRow, move.startCol)
+        endBit = squareBit(move.endRow, move.endCol)
+        bitboards[move.pieceMoved] ^= startBit | endBit
+        occupancy[color] ^= startBit | endBit
+        if move.isCapture:
+            if move.enPassant:
+                captureBit = squareBit(move.startRow, move.endCol)
+            else:
+                captureBit = endBit
+            bitboards[move.pieceCaptured] ^= captureBit
+            occupancy[move.pieceCaptured[0]] ^= captureBit
+        if move.pawnPromotion:
+            bitboards[move.pieceMoved] ^= endBit
+            bitboards[color + move.promotionPiece] ^= endBit
+        if move.castle:
+            if move.endCol - move.startCol == 2:
+                rookBits = endBit << 1 | endBit >> 1
+            else:
+                rookBits = endBit >> 2 | endBit << 1
+            bitboards[color + "R"] ^= rookBits
+            occupancy[color] ^= rookBits
+
+    """
+    Hash the whole position from scratch
+    makeMove keeps the key up to date incrementally, this is for setup and checking
+    """
+
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                square = self.board[r][c]
+                if square != "--":
+                    key ^= ZOBRIST_PIECES[square][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key ^ self.getCastleAndEnPassantKey()
+
+    """
+    The en passant file is only part of the key when a pawn of the side to move
+    stands next to the pawn that just moved two squares (as in Polyglot keys).
+    Otherwise the position after the push is the same as when it comes back,
+    and repetitions have to see that
+    """
+
+    def getCastleAndEnPassantKey(self):
+        key = ZOBRIST_CASTLING[self.castlingRights]
+        if self.enPassantPossible != ():
+            row, col = self.enPassantPossible
+            if self.whiteToMove:
+                row, capturer = row + 1, "wp"
+            else:
+                row, capturer = row - 1, "bp"
+            if (col > 0 and self.board[row][col - 1] == capturer) or (
+                col < 7 and self.board[row][col + 1] == capturer
+            ):
+                key ^= ZOBRIST_EN_PASSANT[col]
+        return key
+
+    """
+    Count earlier occurrences of the current position, looking only at
+    positions with the same side to move
+    """
+
+    def isRepetition(self, count=3):
+        key = self.zobristKey
+        seen = 1
+        # A capture or pawn move can't be undone, so nothing before it can repeat.
+        # stateLog[-1] holds the key before the last move, stateLog[-2] the key
+        # the last time this side was to move, and so on
+        for state in self.stateLog[-2 : -self.halfmoveClock - 1 : -2]:
+            if state[3] == key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
 
     """ Takes a move as a parameter. Will not move for castling, en passant, pawn promotion """
 
     def makeMove(self, move):
+        scoreDelta = getBoardScoreDelta(move)
+        self.stateLog.append(
+            (
+                self.castlingRights,
+                self.enPassantPossible,
+                self.halfmoveClock,
+                self.zobristKey,
+                scoreDelta,
+            )
+        )
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE ^ self.getCastleAndEnPassantKey()
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move)  # Log move
@@ -72,7 +502,7 @@ class GameState:
             self.board[move.startRow][move.endCol] = "--"
         # Pawn promotion
         if move.pawnPromotion:
-            promotedPiece = "Q"
+            promotedPiece = move.promotionPiece
             self.board[move.endRow][move.endCol] = move.pieceMoved[0] + promotedPiece
         if move.castle:
             if move.endCol - move.startCol == 2:
@@ -86,18 +516,72 @@ class GameState:
                 ]
                 self.board[move.endRow][move.endCol - 2] = "--"
 
-        self.enPassantPossibleLog.append(self.enPassantPossible)
+        if move.pieceMoved[1] == "p" or move.isCapture:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if move.pieceMoved[0] == "b":
+            self.fullmoveNumber += 1
+
+        # Update Castling Rights - If a rook or a king moves, or a rook is captured
+        self.castlingRights &= (
+            CASTLING_RIGHTS_KEPT[move.startRow * 8 + move.startCol]
+            & CASTLING_RIGHTS_KEPT[move.endRow * 8 + move.endCol]
+        )
+        self.updateBitboards(move)
+        self.zobristKey = (
+            key ^ getZobristMoveKey(move) ^ self.getCastleAndEnPassantKey()
+        )
+        self.boardScore += scoreDelta
 
-        # Update Castling Rights - If a rook or a king moves
-        self.updateCastleRights(move)
-        self.castlingRightsLog.append(
-            CastleRights(
-                self.currentCastlingRight.wks,
-                self.currentCastlingRight.bks,
-                self.currentCastlingRight.wqs,
-                self.currentCastlingRight.bqs,
+    """
+    Pass the turn, for null move pruning. It is logged as None in moveLog, and
+    undoMove takes it back like any move. Repetitions aren't looked for across
+    it, so it also resets the fifty move count until it is undone
+    """
+
+    def makeNullMove(self):
+        self.stateLog.append(
+            (
+                self.castlingRights,
+                self.enPassantPossible,
+                self.halfmoveClock,
+                self.zobristKey,
+                0,
             )
         )
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE ^ self.getCastleAndEnPassantKey()
+        self.enPassantPossible = ()
+        self.zobristKey = key ^ self.getCastleAndEnPassantKey()
+        self.halfmoveClock = 0
+        self.moveLog.append(None)
+        self.whiteToMove = not self.whiteToMove
+
+    """
+    Is the side to move in check? Read from the bitboards without generating
+    moves, since inCheck is only brought up to date by move generation
+    """
+
+    def isKingAttacked(self):
+        allyColor, enemyColor = ("w", "b") if self.whiteToMove else ("b", "w")
+        kingSq = self.bitboards[allyColor + "K"].bit_length() - 1
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        return attackersTo(self.bitboards, kingSq, enemyColor, occupied) != 0
+
+    """
+    Does the side to move have a piece other than pawns and the king? Without
+    one, zugzwang is common and passing is no guide to the position
+    """
+
+    def hasNonPawnMaterial(self):
+        color = "w" if self.whiteToMove else "b"
+        bitboards = self.bitboards
+        return (
+            bitboards[color + "N"]
+            | bitboards[color + "B"]
+            | bitboards[color + "R"]
+            | bitboards[color + "Q"]
+        ) != 0
 
     """ 
     Undo last move
@@ -106,6 +590,16 @@ class GameState:
     def undoMove(self):
         if len(self.moveLog) != 0:
             move = self.moveLog.pop()
+            if move is None:  # Null move
+                (
+                    self.castlingRights,
+                    self.enPassantPossible,
+                    self.halfmoveClock,
+                    self.zobristKey,
+                    _,
+                ) = self.stateLog.pop()
+                self.whiteToMove = not self.whiteToMove
+                return
             self.board[move.startRow][move.startCol] = move.pieceMoved
             self.board[move.endRow][move.endCol] = move.pieceCaptured
             self.whiteToMove = not self.whiteToMove
@@ -118,14 +612,15 @@ class GameState:
                 self.board[move.endRow][move.endCol] = "--"
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
 
-            self.enPassantPossibleLog.pop()
-            self.enPassantPossible = self.enPassantPossibleLog[-1]
-
-            self.castlingRightsLog.pop()
-            newRights = self.castlingRightsLog[-1]
-            self.currentCastlingRight = CastleRights(
-                newRights.wks, newRights.bks, newRights.wqs, newRights.bqs
-            )
+            (
+                self.castlingRights,
+                self.enPassantPossible,
+                self.halfmoveClock,
+                self.zobristKey,
+                scoreDelta,
+            ) = self.stateLog.pop()
+            if move.pieceMoved[0] == "b":
+                self.fullmoveNumber -= 1
 
             if move.castle:
                 if move.endCol - move.startCol == 2:
@@ -139,55 +634,303 @@ class GameState:
                     ]
                     self.board[move.endRow][move.endCol + 1] = "--"
 
+            self.updateBitboards(move)
+            self.boardScore -= scoreDelta
             self.checkMate = False
             self.staleMate = False
             self.drawByRepetition = False
 
     """
-    Update the castle rights; Whether the King or Knight moved
+    All moves considering checks... Valid moves
     """
 
-    def updateCastleRights(self, move):
-        if move.pieceMoved == "wK":
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0:  # Left Rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7:
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0:  # Left Rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7:
-                    self.currentCastlingRight.bks = False
-
-        # When rook is captured
-        if move.pieceCaptured == "wR":
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRight.wqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.wks = False
-        elif move.pieceCaptured == "bR":
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentCastlingRight.bqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.bks = False
+    def getValidMoves(self):
+        if self.useBitboards:
+            moves = self.getBitboardMoves()
+        else:
+            moves = self.getBoardScanMoves()
+
+        if len(moves) == 0:
+            if self.inCheck:
+                self.checkMate = True
+            else:
+                self.staleMate = True
+        else:
+            self.checkMate = False
+            self.staleMate = False
+        self.drawByRepetition = self.isRepetition()
+
+        return moves
 
     """
-    All moves considering checks... Valid moves
+    Legal moves from the bitboards
+    Pins, checks and the squares the enemy attacks are all worked out once per
+    position (getMoveContext), so no move has to be made or tested afterwards
     """
 
-    def getValidMoves(self):
+    def getBitboardMoves(self, stage=ALL_MOVES):
         moves = []
-        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        self.addBitboardMoves(self.getMoveContext(), stage, moves)
+        return moves
+
+    """
+    Only captures and promotions, for the quiescence search
+    Sets inCheck, but not checkMate/staleMate since quiet moves are not looked at
+    """
+
+    def getCaptureMoves(self):
+        return self.getBitboardMoves(CAPTURE_MOVES)
+
+    """
+    Staged move generator: yields the hash move (a moveID, if it is legal here),
+    then captures and promotions, then quiet moves. A stage is only generated
+    once the search has used up the one before, so a cutoff on an early move
+    skips generating the rest. orderMoves, if given, turns each stage's list
+    into the order to search it in. Sets checkMate/staleMate if nothing is legal
+    """
+
+    def generateMoves(self, hashMove=0, orderMoves=None):
+        if not self.useBitboards:  # The board scan only makes whole lists
+            moves = self.getValidMoves()
+            hashMoves = [move for move in moves if move.moveID == hashMove]
+            otherMoves = [move for move in moves if move.moveID != hashMove]
+            if orderMoves is not None:
+                otherMoves = orderMoves(otherMoves)
+            yield from hashMoves
+            yield from otherMoves
+            return
+        context = self.getMoveContext()
+        found = False
+        if hashMove:
+            pieceMoves = []
+            self.addBitboardMoves(context, ALL_MOVES, pieceMoves, 1 << (hashMove & 63))
+            for move in pieceMoves:
+                if move.moveID == hashMove:
+                    found = True
+                    yield move
+                    break
+            else:
+                hashMove = 0
+        for stage in (CAPTURE_MOVES, QUIET_MOVES):
+            moves = []
+            self.addBitboardMoves(context, stage, moves)
+            if orderMoves is not None:
+                moves = orderMoves(moves)
+            for move in moves:
+                if move.moveID != hashMove:
+                    found = True
+                    yield move
+        if not found:
+            self.checkMate = context[6] != 0
+            self.staleMate = not self.checkMate
+
+    """
+    Everything about the position the generators need, computed once:
+    (allyColor, enemyColor, allies, enemies, occupied, kingSq, checkers,
+    danger, targetMask, pinned, pinLines)
+    """
+
+    def getMoveContext(self):
+        bitboards = self.bitboards
+        if self.whiteToMove:
+            allyColor, enemyColor = "w", "b"
+        else:
+            allyColor, enemyColor = "b", "w"
+        allies = self.occupancy[allyColor]
+        enemies = self.occupancy[enemyColor]
+        occupied = allies | enemies
+        kingBit = bitboards[allyColor + "K"]
+        kingSq = kingBit.bit_length() - 1
+        enemyQueens = bitboards[enemyColor + "Q"]
+        enemyRooks = bitboards[enemyColor + "R"] | enemyQueens
+        enemyBishops = bitboards[enemyColor + "B"] | enemyQueens
+
+        checkers = attackersTo(bitboards, kingSq, enemyColor, occupied)
+        self.inCheck = checkers != 0
+        # The king is left out so that it cannot step back along a checking ray
+        danger = attackedSquares(bitboards, enemyColor, occupied ^ kingBit)
+        if checkers & (checkers - 1):  # Double check: only the king can move
+            targetMask = 0
+        elif checkers:
+            targetMask = BETWEEN[kingSq][checkers.bit_length() - 1] | checkers
+        else:
+            targetMask = FULL_BOARD
+
+        # Pinned pieces may only move along the line to their king
+        pinned = 0
+        pinLines = {}
+        snipers = (rookAttacks(kingSq, enemies) & enemyRooks) | (
+            bishopAttacks(kingSq, enemies) & enemyBishops
+        )
+        for sniper in iterateBits(snipers):
+            blockers = BETWEEN[kingSq][sniper] & occupied
+            if blockers and not blockers & (blockers - 1):
+                pinned |= blockers
+                pinLines[blockers] = LINE[kingSq][sniper]
+        return (
+            allyColor,
+            enemyColor,
+            allies,
+            enemies,
+            occupied,
+            kingSq,
+            checkers,
+            danger,
+            targetMask,
+            pinned,
+            pinLines,
+        )
+
+    """
+    Add the legal moves of one stage, for the pieces in pieceMask
+    """
+
+    def addBitboardMoves(self, context, stage, moves, pieceMask=FULL_BOARD):
+        (
+            allyColor,
+            enemyColor,
+            allies,
+            enemies,
+            occupied,
+            kingSq,
+            checkers,
+            danger,
+            targetMask,
+            pinned,
+            pinLines,
+        ) = context
+        board = self.board
+        bitboards = self.bitboards
+        if stage == CAPTURE_MOVES:
+            stageTargets = enemies
+        elif stage == QUIET_MOVES:
+            stageTargets = ~occupied
+        else:
+            stageTargets = ~allies
+        if (1 << kingSq) & pieceMask:
+            for sq in iterateBits(KING_ATTACKS[kingSq] & ~danger & stageTargets):
+                moves.append(Move.fromID(kingSq | sq << 6, board))
+        if not targetMask:
+            return
+
+        targets = stageTargets & targetMask
+        for sq in iterateBits(bitboards[allyColor + "N"] & ~pinned & pieceMask):
+            for end in iterateBits(KNIGHT_ATTACKS[sq] & targets):
+                moves.append(Move.fromID(sq | end << 6, board))
+        for attacks, pieces in (
+            (rookAttacks, bitboards[allyColor + "R"]),
+            (bishopAttacks, bitboards[allyColor + "B"]),
+            (queenAttacks, bitboards[allyColor + "Q"]),
+        ):
+            for sq in iterateBits(pieces & pieceMask):
+                bit = 1 << sq
+                pieceTargets = attacks(sq, occupied) & targets
+                if bit & pinned:
+                    pieceTargets &= pinLines[bit]
+                for end in iterateBits(pieceTargets):
+                    moves.append(Move.fromID(sq | end << 6, board))
+
+        self.addBitboardPawnMoves(context, stage, moves, pieceMask)
+        if self.enPassantPossible != () and stage != QUIET_MOVES:
+            self.addBitboardEnPassantMoves(context, moves, pieceMask)
+        if not checkers and stage != CAPTURE_MOVES and (1 << kingSq) & pieceMask:
+            self.addBitboardCastleMoves(kingSq, occupied, danger, moves)
+
+    def addBitboardPawnMoves(self, context, stage, moves, pieceMask=FULL_BOARD):
+        allyColor = context[0]
+        enemies, occupied = context[3], context[4]
+        targetMask, pinned, pinLines = context[8], context[9], context[10]
+        board = self.board
+        pawns = self.bitboards[allyColor + "p"] & pieceMask
+        empty = ~occupied
+        backRows = ROW_MASKS[0] | ROW_MASKS[7]
+        if (
+            stage == CAPTURE_MOVES
+        ):  # Promotions are the only pushes that change material
+            empty &= backRows
+        elif stage == QUIET_MOVES:
+            empty &= ~backRows
+            enemies = 0
+        if allyColor == "w":
+            pushes = (pawns >> 8) & empty
+            doublePushes = ((pushes & ROW_MASKS[5]) >> 8) & empty
+            # (end squares, start square - end square)
+            patterns = (
+                (pushes, 8),
+                (doublePushes, 16),
+                (((pawns & NOT_FILE_A) >> 9) & enemies, 9),
+                (((pawns & NOT_FILE_H) >> 7) & enemies, 7),
+            )
+        else:
+            pushes = (pawns << 8) & empty
+            doublePushes = ((pushes & ROW_MASKS[2]) << 8) & empty
+            patterns = (
+                (pushes, -8),
+                (doublePushes, -16),
+                (((pawns & NOT_FILE_A) << 7) & enemies, -7),
+                (((pawns & NOT_FILE_H) << 9) & enemies, -9),
+            )
+        for ends, offset in patterns:
+            for end in iterateBits(ends & targetMask):
+                start = end + offset
+                startBit = 1 << start
+                if startBit & pinned and not pinLines[startBit] & (1 << end):
+                    continue
+                moveID = start | end << 6
+                if (1 << end) & backRows:
+                    for promotion in range(len(PROMOTION_PIECES)):
+                        moves.append(Move.fromID(moveID | promotion << 12, board))
+                else:
+                    moves.append(Move.fromID(moveID, board))
+
+    def addBitboardEnPassantMoves(self, context, moves, pieceMask=FULL_BOARD):
+        allyColor, enemyColor = context[0], context[1]
+        occupied, kingSq, checkers = context[4], context[5], context[6]
+        bitboards = self.bitboards
+        endRow, endCol = self.enPassantPossible
+        end = endRow * 8 + endCol
+        capturedRow = endRow + 1 if allyColor == "w" else endRow - 1
+        capturedBit = squareBit(capturedRow, endCol)
+        if (
+            checkers
+            and checkers != capturedBit
+            and not BETWEEN[kingSq][checkers.bit_length() - 1] & (1 << end)
+        ):
+            return
+        pawns = bitboards[allyColor + "p"] & pieceMask
+        for start in iterateBits(PAWN_ATTACKS[enemyColor][end] & pawns):
+            # Both pawns leave their squares at once, so test the position after
+            afterOccupied = occupied ^ (1 << start) ^ capturedBit ^ (1 << end)
+            bitboards[enemyColor + "p"] ^= capturedBit
+            attacked = attackersTo(bitboards, kingSq, enemyColor, afterOccupied)
+            bitboards[enemyColor + "p"] ^= capturedBit
+            if not attacked:
+                moves.append(Move.fromID(start | end << 6, self.board))
+
+    def addBitboardCastleMoves(self, kingSq, occupied, danger, moves):
+        if self.whiteToMove:
+            kingside = self.castlingRights & WHITE_KINGSIDE
+            queenside = self.castlingRights & WHITE_QUEENSIDE
+        else:
+            kingside = self.castlingRights & BLACK_KINGSIDE
+            queenside = self.castlingRights & BLACK_QUEENSIDE
+        if kingside:
+            path = 3 << (kingSq + 1)
+            if not path & (occupied | danger):
+                moves.append(Move.fromID(kingSq | (kingSq + 2) << 6, self.board))
+        if queenside:
+            path = 3 << (kingSq - 2)
+            if not (path | 1 << (kingSq - 3)) & occupied and not path & danger:
+                moves.append(Move.fromID(kingSq | (kingSq - 2) << 6, self.board))
+
+    """
+    Legal moves by scanning the board square by square
+    """
+
+    def getBoardScanMoves(self):
+        moves = []
+        self.attackMap = self.getAttackMap()
+        self.inCheck, self.pinDirections, self.checks = self.checkForPinsAndChecks()
         if self.whiteToMove:
             kingRow = self.whiteKingLocation[0]
             kingCol = self.whiteKingLocation[1]
@@ -197,46 +940,24 @@ class GameState:
 
         if self.inCheck:
             if len(self.checks) == 1:
-                moves = self.getAllPossibleMoves()
-                check = self.checks[0]
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]
-                validSquares = []
-                if pieceChecking[1] == "N":
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8):
-                        validSquare = (kingRow + check[2] * i, kingCol + check[3] * i)
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol:
-                            break
-                for i in range(len(moves) - 1, -1, -1):
-                    if moves[i].pieceMoved[1] != "K":
-                        if not (moves[i].endRow, moves[i].endCol) in validSquares:
-                            moves.remove(moves[i])
+                checkRow, checkCol = self.checks[0][:2]
+                evasionMask = self.getEvasionMask(kingRow, kingCol, self.checks[0])
+                moves = [
+                    move
+                    for move in self.getAllPossibleMoves()
+                    if move.pieceMoved[1] == "K"
+                    or evasionMask[move.endRow * 8 + move.endCol]
+                    # En passant takes a checking pawn without landing on it
+                    or (
+                        move.enPassant
+                        and (move.startRow, move.endCol) == (checkRow, checkCol)
+                    )
+                ]
             else:
                 self.getKingMoves(kingRow, kingCol, moves)
         else:  # If not in check, all moves should work
             moves = self.getAllPossibleMoves()
 
-        if len(moves) == 0:
-            if self.inCheck:
-                self.checkMate = True
-            else:
-                self.staleMate = True
-        else:
-            self.checkMate = False
-            self.staleMate = False
-        if (
-            len(self.moveLog) >= 10
-            and self.moveLog[-2:] == self.moveLog[-6:-4] == self.moveLog[-10:-8]
-            and self.moveLog[-4:-2] == self.moveLog[-8:-6]
-        ):
-            self.drawByRepetition = True
-        else:
-            self.drawByRepetition = False
-
         if self.whiteToMove:
             self.getCastleMoves(
                 self.whiteKingLocation[0], self.whiteKingLocation[1], moves
@@ -248,8 +969,14 @@ class GameState:
 
         return moves
 
+    """
+    Checks on the king of the side to move, as (row, col, rowStep, colStep) of
+    the checking piece, and the pinned pieces as square -> direction from the
+    king. A pinned piece may only move along that line
+    """
+
     def checkForPinsAndChecks(self):
-        pins = []
+        pinDirections = {}
         checks = []
         inCheck = False
         if self.whiteToMove:
@@ -263,99 +990,115 @@ class GameState:
             startRow = self.blackKingLocation[0]
             startCol = self.blackKingLocation[1]
 
-        directions = (
-            (-1, 0),
-            (0, -1),
-            (1, 0),
-            (0, 1),
-            (-1, -1),
-            (-1, 1),
-            (1, -1),
-            (1, 1),
-        )
-        for j in range(len(directions)):
-            d = directions[j]
+        board = self.board
+        rays = RAYS[startRow * 8 + startCol]
+        for j in range(8):
+            d = KING_STEPS[j]
             possiblePin = ()
-            for i in range(1, 8):
-                endRow = startRow + d[0] * i
-                endCol = startCol + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor and endPiece[1] != "K":
+            for i, (endRow, endCol) in enumerate(rays[j], 1):
+                endPiece = board[endRow][endCol]
+                if endPiece[0] == allyColor and endPiece[1] != "K":
+                    if possiblePin == ():
+                        possiblePin = endRow * 8 + endCol
+                    else:
+                        break
+                elif endPiece[0] == enemyColor:
+                    type = endPiece[1]
+                    # 1. Orthogonal rook
+                    # 2. Diagonal bishop
+                    # 3. 1 away pawn
+                    # 4. Any direction queen
+                    # 5. 1 away king
+                    if (
+                        (0 <= j < 4 and type == "R")
+                        or (4 <= j < 8 and type == "B")
+                        or (
+                            i == 1
+                            and type == "p"
+                            and (
+                                (enemyColor == "w" and 6 <= j <= 7)
+                                or (enemyColor == "b" and 4 <= j <= 5)
+                            )
+                        )
+                        or (type == "Q")
+                        or (i == 1 and type == "K")
+                    ):
                         if possiblePin == ():
-                            possiblePin = (endRow, endCol, d[0], d[1])
-                        else:
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
                             break
-                    elif endPiece[0] == enemyColor:
-                        type = endPiece[1]
-                        if (
-                            (0 <= j < 4 and type == "R")
-                            or (4 <= j < 8 and type == "B")
-                            or (
-                                i == 1
-                                and type == "p"
-                                and (
-                                    (enemyColor == "w" and 6 <= j <= 7)
-                                    or (enemyColor == "b" and 4 <= j <= 5)
-                                )
-                            )
-                            or (type == "Q")
-                            or (i == 1 and type == "K")
-                        ):
-                            if possiblePin == ():
-                                inCheck = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                                break
-                            else:
-                                pins.append(possiblePin)
-                                break
                         else:
+                            pinDirections[possiblePin] = d
                             break
-                else:
+                    else:
+                        break
+        # Knights
+        for endRow, endCol in KNIGHT_TARGETS[startRow * 8 + startCol]:
+            if board[endRow][endCol] == enemyColor + "N":
+                inCheck = True
+                checks.append((endRow, endCol, endRow - startRow, endCol - startCol))
+        return inCheck, pinDirections, checks
+
+    """
+    The squares a move other than the king's must land on to answer a single
+    check, as 64 flags: the checking piece, and for a sliding piece the
+    squares between it and the king
+    """
+
+    def getEvasionMask(self, kingRow, kingCol, check):
+        evasionMask = bytearray(64)
+        checkRow, checkCol, rowStep, colStep = check
+        evasionMask[checkRow * 8 + checkCol] = 1
+        if self.board[checkRow][checkCol][1] != "N":
+            ray = RAYS[kingRow * 8 + kingCol][KING_STEPS.index((rowStep, colStep))]
+            for endRow, endCol in ray:
+                if (endRow, endCol) == (checkRow, checkCol):
                     break
-                    # 1. Orthogonal rook
-                    # 2. Diagonal bishop
-                    # 3. 1 away pawn
-                    # 4. Any direction queen
-                    # 5. Knights
-        knightMoves = (
-            (-2, -1),
-            (-2, 1),
-            (-1, -2),
-            (-1, 2),
-            (1, -2),
-            (1, 2),
-            (2, -1),
-            (2, 1),
-        )
-        for m in knightMoves:
-            endRow = startRow + m[0]
-            endCol = startCol + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] == enemyColor and endPiece[1] == "N":
-                    inCheck = True
-                    checks.append((endRow, endCol, m[0], m[1]))
-        return inCheck, pins, checks
-
-    def inCheck(self):
-        if self.whiteToMove:
-            return self.squareUnderAttack(
-                self.whiteKingLocation[0], self.whiteKingLocation[1]
-            )
-        else:
-            return self.squareUnderAttack(
-                self.blackKingLocation[0], self.blackKingLocation[1]
-            )
+                evasionMask[endRow * 8 + endCol] = 1
+        return evasionMask
 
-    def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:
-                return True
-        return False
+    """
+    Every square the side not to move attacks, as 64 flags by row * 8 + col.
+    The king of the side to move doesn't block: the square behind it on a
+    checking line is attacked too, so it can't step back along the line.
+    Made once per node for king moves, castling and check
+    """
+
+    def getAttackMap(self):
+        attackMap = bytearray(64)
+        board = self.board
+        enemyColor = "b" if self.whiteToMove else "w"
+        allyKing = "wK" if self.whiteToMove else "bK"
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != enemyColor:
+                    continue
+                pieceType = piece[1]
+                square = r * 8 + c
+                if pieceType == "p":
+                    targets = PAWN_CAPTURES[enemyColor][square]
+                elif pieceType == "N":
+                    targets = KNIGHT_TARGETS[square]
+                elif pieceType == "K":
+                    targets = KING_TARGETS[square]
+                else:
+                    if pieceType == "R":
+                        rays = RAYS[square][:4]
+                    elif pieceType == "B":
+                        rays = RAYS[square][4:]
+                    else:
+                        rays = RAYS[square]
+                    for ray in rays:
+                        for endRow, endCol in ray:
+                            attackMap[endRow * 8 + endCol] = 1
+                            endPiece = board[endRow][endCol]
+                            if endPiece != "--" and endPiece != allyKing:
+                                break
+                    continue
+                for endRow, endCol in targets:
+                    attackMap[endRow * 8 + endCol] = 1
+        return attackMap
 
     """
     All moves without considering checks
@@ -380,248 +1123,129 @@ class GameState:
     """
 
     def getPawnMoves(self, r, c, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+        pinDirection = self.pinDirections.get(r * 8 + c)
         if self.whiteToMove:
+            allyColor = "w"
             moveAmount = -1
-            startRow = 6
             backRow = 0
             enemyColor = "b"
             kingRow, kingCol = self.whiteKingLocation
         else:
+            allyColor = "b"
             moveAmount = 1
-            startRow = 1
             backRow = 7
             enemyColor = "w"
             kingRow, kingCol = self.blackKingLocation
-        pawnPromotion = False
+        board = self.board
+        square = r * 8 + c
+
+        pushes = PAWN_PUSHES[allyColor][square]
+        if board[r + moveAmount][c] == "--":
+            # Pinned along its file, a pawn may still push towards or away from the king
+            if pinDirection is None or pinDirection[1] == 0:
+                self.addPawnMoves((r, c), pushes[0], pushes[0][0] == backRow, moves)
+                if len(pushes) == 2 and board[pushes[1][0]][c] == "--":
+                    moves.append(Move((r, c), pushes[1], board))
+        for endRow, endCol in PAWN_CAPTURES[allyColor][square]:
+            if pinDirection is not None and pinDirection not in (
+                (moveAmount, endCol - c),
+                (-moveAmount, c - endCol),
+            ):
+                continue
+            if board[endRow][endCol][0] == enemyColor:
+                self.addPawnMoves((r, c), (endRow, endCol), endRow == backRow, moves)
+            elif (endRow, endCol) == self.enPassantPossible:
+                # Both pawns leave the row: does that open it to a rook or queen?
+                attackingPiece = blockingPiece = False
+                if kingRow == r:
+                    left = min(c, endCol)
+                    right = max(c, endCol)
+                    if kingCol < left:  # King to the left of pawns
+                        # inside: Between king and pawn
+                        insideRange = range(kingCol + 1, left)
+                        # outside: Between pawn and border
+                        outsideRange = range(right + 1, 8)
+                    else:  # King to the right of the pawns
+                        insideRange = range(kingCol - 1, right, -1)
+                        outsideRange = range(left - 1, -1, -1)
+                    for i in insideRange:
+                        if board[r][i] != "--":
+                            blockingPiece = True
+                    for i in outsideRange:  # Only the first piece matters
+                        square = board[r][i]
+                        if square[0] == enemyColor and (
+                            square[1] == "R" or square[1] == "Q"
+                        ):
+                            attackingPiece = True
+                            break
+                        elif square != "--":
+                            break
+                if not attackingPiece or blockingPiece:
+                    moves.append(Move((r, c), (endRow, endCol), board))
 
-        if self.board[r + moveAmount][c] == "--":
-            if not piecePinned or pinDirection == (moveAmount, 0):
-                if r + moveAmount == backRow:
-                    pawnPromotion = True
+    def addPawnMoves(self, startSq, endSq, pawnPromotion, moves):
+        if pawnPromotion:
+            for promotionPiece in PROMOTION_PIECES:
                 moves.append(
-                    Move(
-                        (r, c),
-                        (r + moveAmount, c),
-                        self.board,
-                        pawnPromotion=pawnPromotion,
-                    )
+                    Move(startSq, endSq, self.board, promotionPiece=promotionPiece)
                 )
-                if r == startRow and self.board[r + 2 * moveAmount][c] == "--":
-                    moves.append(Move((r, c), (r + 2 * moveAmount, c), self.board))
-        if c - 1 >= 0:
-            if not piecePinned or pinDirection == (moveAmount, -1):
-                if self.board[r + moveAmount][c - 1][0] == enemyColor:
-                    if r + moveAmount == backRow:
-                        pawnPromotion = True
-                    moves.append(
-                        Move(
-                            (r, c),
-                            (r + moveAmount, c - 1),
-                            self.board,
-                            pawnPromotion=pawnPromotion,
-                        )
-                    )
-                if (r + moveAmount, c - 1) == self.enPassantPossible:
-                    attackingPiece = blockingPiece = False
-                    if kingRow == r:
-                        if kingCol < c:  # King to the left of pawns
-                            # inside: Between king and pawn
-                            insideRange = range(kingCol + 1, c - 1)
-                            # outside: Between pawn and border
-                            outsideRange = range(c + 1, 8)
-                        else:  # King to the right of the pawns
-                            insideRange = range(kingCol - 1, c, -1)
-                            outsideRange = range(c - 2, -1, -1)
-                        for i in insideRange:
-                            if self.board[r][i] != "--":
-                                blockingPiece = True
-                        for i in outsideRange:
-                            square = self.board[r][i]
-                            if square[0] == enemyColor and (
-                                square[1] == "R" or square[1] == "Q"
-                            ):
-                                attackingPiece = True
-                            elif square != "--":
-                                blockingPiece = True
-                    if not attackingPiece or blockingPiece:
-                        moves.append(
-                            Move(
-                                (r, c),
-                                (r + moveAmount, c - 1),
-                                self.board,
-                                enPassant=True,
-                            )
-                        )
-        if c + 1 <= 7:
-            if not piecePinned or pinDirection == (moveAmount, 1):
-                if self.board[r + moveAmount][c + 1][0] == enemyColor:
-                    if r + moveAmount == backRow:
-                        pawnPromotion = True
-                    moves.append(
-                        Move(
-                            (r, c),
-                            (r + moveAmount, c + 1),
-                            self.board,
-                            pawnPromotion=pawnPromotion,
-                        )
-                    )
-                if (r + moveAmount, c + 1) == self.enPassantPossible:
-                    attackingPiece = blockingPiece = False
-                    if kingRow == r:
-                        if kingCol < c:  # King to the left of pawns
-                            # inside: Between king and pawn
-                            insideRange = range(kingCol + 1, c)
-                            # outside: Between pawn and border
-                            outsideRange = range(c + 2, 8)
-                        else:  # King to the right of the pawns
-                            insideRange = range(kingCol - 1, c + 1, -1)
-                            outsideRange = range(c - 1, -1, -1)
-                        for i in insideRange:
-                            if self.board[r][i] != "--":
-                                blockingPiece = True
-                        for i in outsideRange:
-                            square = self.board[r][i]
-                            if square[0] == enemyColor and (
-                                square[1] == "R" or square[1] == "Q"
-                            ):
-                                attackingPiece = True
-                            elif square != "--":
-                                blockingPiece = True
-                    if not attackingPiece or blockingPiece:
-                        moves.append(
-                            Move(
-                                (r, c),
-                                (r + moveAmount, c + 1),
-                                self.board,
-                                enPassant=True,
-                            )
-                        )
+        else:
+            moves.append(Move(startSq, endSq, self.board))
 
     def getRookMoves(self, r, c, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                if self.board[r][c][1] != "Q":
-                    self.pins.remove(self.pins[i])
-                break
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))  # up left down right
-        enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:  # On the board
-                    if (
-                        not piecePinned
-                        or pinDirection == d
-                        or pinDirection == (-d[0], -d[1])
-                    ):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:  # Enemy piece
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else:  # Friendly piece
-                            break
-                else:  # Off board
-                    break
+        self.getSlidingMoves(r, c, range(4), moves)
 
     def getKnightMoves(self, r, c, moves):
-        piecePinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                self.pins.remove(self.pins[i])
-                break
-        knightMoves = (
-            (-2, -1),
-            (-2, 1),
-            (-1, -2),
-            (-1, 2),
-            (1, -2),
-            (1, 2),
-            (2, -1),
-            (2, 1),
-        )
-        enemyColor = "b" if self.whiteToMove else "w"
-        for m in knightMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                if not piecePinned:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == enemyColor or endPiece == "--":
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+        if r * 8 + c in self.pinDirections:  # A knight can't stay on the pin line
+            return
+        allyColor = "w" if self.whiteToMove else "b"
+        for endRow, endCol in KNIGHT_TARGETS[r * 8 + c]:
+            if self.board[endRow][endCol][0] != allyColor:
+                moves.append(Move((r, c), (endRow, endCol), self.board))
 
     def getBishopMoves(self, r, c, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-        directions = ((-1, -1), (1, -1), (-1, 1), (1, 1))  # up left down right
+        self.getSlidingMoves(r, c, range(4, 8), moves)
+
+    """
+    Moves along the rays with these indices (0-3 orthogonal, 4-7 diagonal), up
+    to and including the first enemy piece. A pinned piece only moves along
+    its pin line
+    """
+
+    def getSlidingMoves(self, r, c, directions, moves):
+        board = self.board
+        pinDirection = self.pinDirections.get(r * 8 + c)
         enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:  # On the board
-                    if (
-                        not piecePinned
-                        or pinDirection == d
-                        or pinDirection == (-d[0], -d[1])
-                    ):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:  # Enemy piece
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else:  # Friendly piece
-                            break
-                else:  # Off board
+        rays = RAYS[r * 8 + c]
+        for j in directions:
+            d = KING_STEPS[j]
+            if pinDirection is not None and pinDirection not in (d, (-d[0], -d[1])):
+                continue
+            for endRow, endCol in rays[j]:
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    moves.append(Move((r, c), (endRow, endCol), board))
+                elif endPiece[0] == enemyColor:  # Enemy piece
+                    moves.append(Move((r, c), (endRow, endCol), board))
+                    break
+                else:  # Friendly piece
                     break
 
     def getQueenMoves(self, r, c, moves):
         self.getRookMoves(r, c, moves)
         self.getBishopMoves(r, c, moves)
 
+    """
+    King moves to squares the attack map says are safe
+    """
+
     def getKingMoves(self, r, c, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
         allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = r + rowMoves[i]
-            endCol = c + colMoves[i]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:
-                    if allyColor == "w":
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    if allyColor == "w":
-                        self.whiteKingLocation = (r, c)
-                    else:
-                        self.blackKingLocation = (r, c)
+        attackMap = self.attackMap
+        for endRow, endCol in KING_TARGETS[r * 8 + c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor and not attackMap[endRow * 8 + endCol]:
+                moves.append(Move((r, c), (endRow, endCol), self.board))
 
     """
     getCastleMoves()
@@ -630,23 +1254,21 @@ class GameState:
     """
 
     def getCastleMoves(self, r, c, moves):
-        if self.squareUnderAttack(r, c):
+        if self.attackMap[r * 8 + c]:
             return
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (
-            not self.whiteToMove and self.currentCastlingRight.bks
+        if (self.whiteToMove and self.castlingRights & WHITE_KINGSIDE) or (
+            not self.whiteToMove and self.castlingRights & BLACK_KINGSIDE
         ):
             self.getKingsideCastleMoves(r, c, moves)
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (
-            not self.whiteToMove and self.currentCastlingRight.bqs
+        if (self.whiteToMove and self.castlingRights & WHITE_QUEENSIDE) or (
+            not self.whiteToMove and self.castlingRights & BLACK_QUEENSIDE
         ):
             self.getQueensideCastleMoves(r, c, moves)
 
     def getKingsideCastleMoves(self, r, c, moves):
         if self.board[r][c + 1] == "--" and self.board[r][c + 2] == "--":
-            if not self.squareUnderAttack(r, c + 1) and not self.squareUnderAttack(
-                r, c + 2
-            ):
-                moves.append(Move((r, c), (r, c + 2), self.board, castle=True))
+            if not self.attackMap[r * 8 + c + 1] and not self.attackMap[r * 8 + c + 2]:
+                moves.append(Move((r, c), (r, c + 2), self.board))
 
     def getQueensideCastleMoves(self, r, c, moves):
         if (
@@ -654,18 +1276,61 @@ class GameState:
             and self.board[r][c - 2] == "--"
             and self.board[r][c - 3] == "--"
         ):
-            if not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(
-                r, c - 2
-            ):
-                moves.append(Move((r, c), (r, c - 2), self.board, castle=True))
+            if not self.attackMap[r * 8 + c - 1] and not self.attackMap[r * 8 + c - 2]:
+                moves.append(Move((r, c), (r, c - 2), self.board))
 
 
-class CastleRights:
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
+"""
+The part of the Zobrist key a move changes on the board. Like the bitboard
+update it is its own inverse
+"""
+
+
+def getZobristMoveKey(move):
+    pieceKeys = ZOBRIST_PIECES[move.pieceMoved]
+    start = move.startRow * 8 + move.startCol
+    end = move.endRow * 8 + move.endCol
+    key = pieceKeys[start] ^ pieceKeys[end]
+    if move.isCapture:
+        captureSq = move.startRow * 8 + move.endCol if move.enPassant else end
+        key ^= ZOBRIST_PIECES[move.pieceCaptured][captureSq]
+    if move.pawnPromotion:
+        key ^= (
+            pieceKeys[end]
+            ^ ZOBRIST_PIECES[move.pieceMoved[0] + move.promotionPiece][end]
+        )
+    if move.castle:
+        rookKeys = ZOBRIST_PIECES[move.pieceMoved[0] + "R"]
+        if move.endCol - move.startCol == 2:
+            key ^= rookKeys[end + 1] ^ rookKeys[end - 1]
+        else:
+            key ^= rookKeys[end - 2] ^ rookKeys[end + 1]
+    return key
+
+
+"""
+How much a move changes GameState.boardScore
+"""
+
+
+def getBoardScoreDelta(move):
+    pieceScores = PIECE_SQUARE_SCORES[move.pieceMoved]
+    start = move.startRow * 8 + move.startCol
+    end = move.endRow * 8 + move.endCol
+    delta = pieceScores[end] - pieceScores[start]
+    if move.isCapture:
+        captureSq = move.startRow * 8 + move.endCol if move.enPassant else end
+        delta -= PIECE_SQUARE_SCORES[move.pieceCaptured][captureSq]
+    if move.pawnPromotion:
+        promotedScores = PIECE_SQUARE_SCORES[move.pieceMoved[0] + move.promotionPiece]
+        delta += promotedScores[end] - pieceScores[end]
+    if move.castle:
+        rookScores = PIECE_SQUARE_SCORES[move.pieceMoved[0] + "R"]
+        if move.endCol - move.startCol == 2:
+            delta += rookScores[end - 1] - rookScores[end + 1]
+        else:
+            delta += rookScores[end + 1] - rookScores[end - 2]
+    return delta
 
 
 """
@@ -680,25 +1345,72 @@ class Move:
     filestoCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filestoCols.items()}
 
-    def __init__(
-        self, startSq, endSq, board, enPassant=False, pawnPromotion=False, castle=False
-    ):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        self.enPassant = enPassant
-        self.pawnPromotion = pawnPromotion
-        self.castle = castle
-        if enPassant:
-            self.pieceCaptured = "bp" if self.pieceMoved == "wp" else "wp"
-        self.isCapture = self.pieceCaptured != "--"
-        self.moveID = (
-            self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+    # No per move __dict__: the search creates a great many of these
+    __slots__ = (
+        "startRow",
+        "startCol",
+        "endRow",
+        "endCol",
+        "pieceMoved",
+        "pieceCaptured",
+        "enPassant",
+        "pawnPromotion",
+        "castle",
+        "promotionPiece",
+        "isCapture",
+        "moveID",
+    )
+
+    def __init__(self, startSq, endSq, board, promotionPiece="Q"):
+        self.unpack(
+            startSq[0] * 8 + startSq[1]
+            | (endSq[0] * 8 + endSq[1]) << 6
+            | PROMOTION_PIECES.index(promotionPiece) << 12,
+            board,
         )
 
+    """
+    Build a move straight from its packed moveID, without the square tuples
+    """
+
+    @classmethod
+    def fromID(cls, moveID, board):
+        move = cls.__new__(cls)
+        move.unpack(moveID, board)
+        return move
+
+    """
+    moveID packs the move into 14 bits: start square (row * 8 + col) in bits
+    0-5, end square in bits 6-11 and the promotion piece (index into
+    PROMOTION_PIECES) in bits 12-13. Queening keeps the plain ID, so a move
+    entered by two clicks matches it. Castling, en passant and promotion are
+    not stored since the board before the move already tells them apart
+    """
+
+    def unpack(self, moveID, board):
+        self.moveID = moveID
+        self.startRow = startRow = (moveID >> 3) & 7
+        self.startCol = startCol = moveID & 7
+        self.endRow = endRow = (moveID >> 9) & 7
+        self.endCol = endCol = (moveID >> 6) & 7
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
+        pieceCaptured = board[endRow][endCol]
+        self.promotionPiece = PROMOTION_PIECES[moveID >> 12]
+        self.castle = False
+        if pieceMoved[1] == "p":
+            self.pawnPromotion = endRow == 0 or endRow == 7
+            self.enPassant = startCol != endCol and pieceCaptured == "--"
+            if self.enPassant:
+                pieceCaptured = "bp" if pieceMoved == "wp" else "wp"
+        else:
+            self.pawnPromotion = self.enPassant = False
+            if pieceMoved[1] == "K" and (
+                endCol - startCol == 2 or startCol - endCol == 2
+            ):
+                self.castle = True
+        self.pieceCaptured = pieceCaptured
+        self.isCapture = pieceCaptured != "--"
+
     """
     Overriding equals method
     """
@@ -710,9 +1422,12 @@ class Move:
 
     def getChessNotation(self):
         # Further this function to make proper chess notation
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(
             self.endRow, self.endCol
         )
+        if self.pawnPromotion:
+            notation += self.promotionPiece.lower()
+        return notation
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
@@ -726,12 +1441,18 @@ class Move:
         if self.pieceMoved[1] == "p":
             if self.isCapture:
                 if self.pawnPromotion:
-                    return self.colsToFiles[self.startCol] + "x" + endSquare + "=Q"
+                    return (
+                        self.colsToFiles[self.startCol]
+                        + "x"
+                        + endSquare
+                        + "="
+                        + self.promotionPiece
+                    )
                 else:
                     return self.colsToFiles[self.startCol] + "x" + endSquare
             else:
                 if self.pawnPromotion:
-                    return endSquare + "=Q"
+                    return endSquare + "=" + self.promotionPiece
                 else:
                     return endSquare
 
@@ -0,0 +1,108 @@
+"""
+Evaluation tables
+- Material values and piece-square tables
+- The integer centipawn versions are what GameState keeps its running score with
+"""
+
+pieceScores = {"K": 0, "Q": 9, "B": 3, "N": 3, "p": 1, "R": 5}
+knightScore = [
+    [1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1],
+]
+bishopScore = [
+    [4, 3, 2, 1, 1, 2, 3, 4],
+    [3, 4, 3, 2, 2, 3, 4, 3],
+    [2, 3, 4, 3, 3, 4, 3, 2],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [2, 3, 4, 3, 3, 4, 3, 2],
+    [3, 4, 3, 2, 2, 3, 4, 3],
+    [4, 3, 2, 1, 1, 2, 3, 4],
+]
+rookScore = [
+    [4, 3, 4, 4, 4, 4, 3, 4],
+    [4, 4, 4, 4, 4, 4, 4, 4],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [4, 4, 4, 4, 4, 4, 4, 4],
+    [4, 3, 4, 4, 4, 4, 3, 4],
+]
+queenScore = [
+    [1, 1, 1, 3, 1, 1, 1, 1],
+    [1, 2, 3, 3, 3, 1, 1, 1],
+    [1, 4, 3, 3, 3, 4, 2, 1],
+    [1, 2, 3, 3, 3, 2, 2, 1],
+    [1, 2, 3, 3, 3, 2, 2, 1],
+    [1, 4, 3, 3, 3, 4, 2, 1],
+    [1, 1, 2, 3, 3, 1, 1, 1],
+    [1, 1, 1, 3, 1, 1, 1, 1],
+]
+wpawnScore = [
+    [9, 9, 9, 9, 9, 9, 9, 9],
+    [8, 8, 8, 8, 8, 8, 8, 8],
+    [3, 4, 5, 6, 6, 5, 4, 3],
+    [2, 3, 4, 5, 5, 4, 3, 2],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [1, 1, 1, 0, 0, 1, 1, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1],
+]
+bpawnScore = [
+    [1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 1, 1, 0, 0, 1, 1, 1],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [2, 3, 4, 5, 5, 4, 3, 2],
+    [3, 4, 5, 6, 6, 5, 4, 3],
+    [8, 8, 8, 8, 8, 8, 8, 8],
+    [9, 9, 9, 9, 9, 9, 9, 9],
+]
+piecePositionScores = {
+    "N": knightScore,
+    "Q": queenScore,
+    "B": bishopScore,
+    "R": rookScore,
+    "wp": wpawnScore,
+    "bp": bpawnScore,
+}
+
+"""
+Centipawn score of every piece on every square: 100 per point of material plus
+10 per point of position, negative for black. Kings are only worth their position (none)
+"""
+PIECE_VALUES = {piece: value * 100 for piece, value in pieceScores.items()}
+PIECE_SQUARE_SCORES = {}
+for color, sign in (("w", 1), ("b", -1)):
+    for piece, value in PIECE_VALUES.items():
+        if piece == "K":
+            positionScores = [[0] * 8 for _ in range(8)]
+        elif piece == "p":
+            positionScores = piecePositionScores[color + piece]
+        else:
+            positionScores = piecePositionScores[piece]
+        PIECE_SQUARE_SCORES[color + piece] = [
+            sign * (value + 10 * positionScores[sq // 8][sq % 8]) for sq in range(64)
+        ]
+
+
+"""
+Score a whole board from scratch. A Positive score is good for white
+"""
+
+
+def computeBoardScore(board):
+    score = 0
+    for row in range(8):
+        for col in range(8):
+            square = board[row][col]
+            if square != "--":
+                score += PIECE_SQUARE_SCORES[square][row * 8 + col]
+    return score
@@ -7,7 +7,7 @@ Driver File
 import pygame as p
 from pygame.constants import K_r, K_z
 import ChessEngine, ChessAI
-from multiprocessing import Process, Queue
+from ChessWorker import SearchWorker
 
 BOARD_WIDTH = BOARD_HEIGHT = 512
 MOVE_LOG_PANEL_WIDTH = 256
@@ -15,6 +15,10 @@ MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
 DIMENSION = 8  # Dimension of a chess board
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 15  # For animations
+AI_THINK_TIME = 2  # Seconds the AI may spend on a move
+AI_WORKERS = ChessAI.SEARCH_WORKERS  # Search processes (1 = single process)
+AI_BOOK = None  # Polyglot opening book (.bin) for the AI, e.g. "books/performance.bin"
+AI_TABLEBASES = None  # Directory of Syzygy tablebases for the AI (needs python-chess)
 IMAGES = {}
 
 """
@@ -57,7 +61,8 @@ def main():
     playerOne = False  # If the human is playing white: True
     playerTwo = False  # If the human is playing black: True
     AIThinking = False
-    moveFinderProcess = None
+    # One search process for the whole game
+    searchWorker = SearchWorker(AI_WORKERS, AI_BOOK, AI_TABLEBASES)
     moveUndone = False
 
     while running:
@@ -90,6 +95,7 @@ def main():
                                 animate = True
                                 sqSelected = ()  # Reset user clicks
                                 playerClicks = []
+                                break  # Promotions match once per piece
                         if not moveMade:
                             playerClicks = [sqSelected]
                 # Was that the user's second click... Move the piece
@@ -103,7 +109,7 @@ def main():
                     animate = False
                     gameOver = False
                     if AIThinking:
-                        moveFinderProcess.terminate()
+                        searchWorker.cancel()
                         AIThinking = False
                     moveUndone = True
                 elif e.key == p.K_r:  # Reset the board when 'r' is pressed
@@ -115,7 +121,7 @@ def main():
                     animate = False
                     gameOver = False
                     if AIThinking:
-                        moveFinderProcess.terminate()
+                        searchWorker.cancel()
                         AIThinking = False
                     moveUndone = True
 
@@ -123,14 +129,13 @@ def main():
         if not gameOver and not humanTurn and not moveUndone:
             if not AIThinking:
                 AIThinking = True
-                returnQueue = Queue()  # Used to pass data between threads
-                moveFinderProcess = Process(
-                    target=ChessAI.findBestMove, args=(gs, validMoves, returnQueue)
-                )
-                moveFinderProcess.start()  # Call function with parameters
+                searchWorker.search(gs, AI_THINK_TIME)
 
-            if not moveFinderProcess.is_alive():
-                AIMove = returnQueue.get()
+            if searchWorker.poll():
+                AIMove = None
+                for move in validMoves:
+                    if move.moveID == searchWorker.bestMoveID:
+                        AIMove = move
                 if AIMove is None:
                     AIMove = ChessAI.findRandomMove(validMoves)
                 gs.makeMove(AIMove)
@@ -165,6 +170,8 @@ def main():
         clock.tick(MAX_FPS)
         p.display.flip()
 
+    searchWorker.close()
+
 
 """
 Draws the squares on the board
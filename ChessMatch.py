@@ -0,0 +1,394 @@
+"""
+Headless engine vs engine matches (no pygame)
+- Plays ChessAI configurations against each other on a process pool
+- Every opening is played twice, once with each engine as white
+- Writes the games as PGN and reports win/draw/loss, the Elo difference and,
+  optionally, a sequential probability ratio test (SPRT) that stops the match
+  as soon as the result is clear
+
+Usage:
+    python ChessMatch.py --games 100
+    python ChessMatch.py --engine name=new nodes=20000 --engine name=old nodes=20000 deltaMargin=300
+    python ChessMatch.py --openings book.epd --concurrency 4 --pgn games.pgn --sprt 0 10
+
+Engine options are key=value words: name, time (seconds per move), nodes,
+depth, hash (transposition table MB), or a ChessAI.Searcher setting such as
+deltaMargin (not workers: games already run one per process). The first engine
+is the one the statistics are reported for
+"""
+
+import argparse
+import inspect
+import math
+import random
+import time
+from multiprocessing import Pool
+
+import ChessAI
+import ChessEngine
+
+MAX_PLIES = 400  # Games still going after this many moves are scored as draws
+PGN_LINE_LENGTH = 80
+# Searcher keyword arguments an engine may set. The table is set with hash;
+# workers can't be, since pool processes can't start Lazy SMP helpers, and
+# nothing here reports profiles
+SEARCHER_SETTINGS = [
+    name
+    for name in inspect.signature(ChessAI.Searcher).parameters
+    if name
+    not in ("tableSizeMB", "sharedTable", "transpositionTable", "workers", "profile")
+]
+engineSearchers = {}  # Searcher per engine name, kept by each pool process
+
+"""
+Engines and openings
+"""
+
+
+def parseEngine(words, number):
+    engine = {
+        "name": "engine" + str(number),
+        "time": None,
+        "nodes": None,
+        "depth": None,
+        "hash": ChessAI.TRANSPOSITION_TABLE_MB,
+        "settings": {},
+    }
+    for word in words:
+        key, separator, text = word.partition("=")
+        if not separator:
+            raise ValueError("Engine option must be key=value: " + word)
+        if key == "name":
+            engine["name"] = text
+        elif key == "time":
+            engine["time"] = float(text)
+        elif key in ("nodes", "depth", "hash"):
+            engine[key] = int(text)
+        elif key in SEARCHER_SETTINGS:
+            engine["settings"][key] = parseValue(text)
+        else:
+            raise ValueError("Unknown engine option: " + key)
+    return engine
+
+
+def parseValue(text):
+    if text in ("True", "False"):
+        return text == "True"
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+"""
+One opening per line, as a FEN or an EPD (a FEN without the move counters,
+optionally followed by operations such as 'id "name";'). Blank lines and lines
+starting with # are skipped
+"""
+
+
+def loadOpenings(path):
+    openings = []
+    with open(path) as file:
+        for line in file:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            counters = [field for field in fields[4:6] if field.isdigit()]
+            if len(counters) < 2:
+                counters = ["0", "1"]
+            openings.append(" ".join(fields[:4] + counters))
+    return openings
+
+
+"""
+Playing games
+"""
+
+
+def pickMove(gs, validMoves, engine):
+    move = engineSearchers[engine["name"]].findBestMoveIterative(
+        gs, validMoves, engine["time"], engine["nodes"], engine["depth"]
+    )
+    if move is None:
+        move = ChessAI.findRandomMove(validMoves)
+    return move
+
+
+def isInsufficientMaterial(board):
+    pieces = [square for row in board for square in row if square[1] not in "K-"]
+    return not pieces or (len(pieces) == 1 and pieces[0][1] in "NB")
+
+
+"""
+Play one game. Returns (gameNumber, result, reason, sanMoves) with result
+"1-0", "0-1" or "1/2-1/2"
+"""
+
+
+def playGame(game):
+    gameNumber, fen, white, black, seed = game
+    random.seed(seed)
+    for engine in (white, black):
+        if engine["name"] not in engineSearchers:
+            engineSearchers[engine["name"]] = ChessAI.Searcher(
+                tableSizeMB=engine["hash"], **engine["settings"]
+            )
+        engineSearchers[engine["name"]].transpositionTable.clear()
+    gs = ChessEngine.GameState.fromFEN(fen)
+    sanMoves = []
+    result = reason = None
+    while result is None:
+        validMoves = gs.getValidMoves()
+        if gs.checkMate:
+            result = "0-1" if gs.whiteToMove else "1-0"
+            reason = "checkmate"
+        elif gs.staleMate:
+            result, reason = "1/2-1/2", "stalemate"
+        elif gs.drawByRepetition:
+            result, reason = "1/2-1/2", "threefold repetition"
+        elif gs.halfmoveClock >= 100:
+            result, reason = "1/2-1/2", "fifty move rule"
+        elif isInsufficientMaterial(gs.board):
+            result, reason = "1/2-1/2", "insufficient material"
+        elif len(sanMoves) >= MAX_PLIES:
+            result, reason = "1/2-1/2", "move limit"
+        else:
+            move = pickMove(gs, validMoves, white if gs.whiteToMove else black)
+            sanMoves.append(gs.getSAN(move, validMoves))
+            gs.makeMove(move)
+    return gameNumber, result, reason, sanMoves
+
+
+def formatPGN(gameNumber, fen, white, black, result, reason, sanMoves):
+    tags = [
+        ("Event", "ChessMatch"),
+        ("Site", "?"),
+        ("Date", time.strftime("%Y.%m.%d")),
+        ("Round", str(gameNumber + 1)),
+        ("White", white["name"]),
+        ("Black", black["name"]),
+        ("Result", result),
+    ]
+    if fen != ChessEngine.STARTING_FEN:
+        tags += [("SetUp", "1"), ("FEN", fen)]
+    lines = ["[" + tag + ' "' + value + '"]' for tag, value in tags]
+    fields = fen.split()
+    whiteToMove = fields[1] == "w"
+    moveNumber = int(fields[5])
+    tokens = []
+    for san in sanMoves:
+        if whiteToMove:
+            tokens.append(str(moveNumber) + ".")
+        elif not tokens:
+            tokens.append(str(moveNumber) + "...")
+        tokens.append(san)
+        if not whiteToMove:
+            moveNumber += 1
+        whiteToMove = not whiteToMove
+    tokens += ["{" + reason + "}", result]
+    lines.append("")
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > PGN_LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+"""
+Statistics, from the first engine's point of view
+"""
+
+
+def getEloDifference(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return math.copysign(math.inf, score - 0.5), math.inf
+    elo = -400 * math.log10(1 / score - 1)
+    # 95% interval from the spread of the per game scores
+    variance = (
+        wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score**2
+    ) / games
+    deviation = math.sqrt(variance / games)
+    upper = min(score + 1.96 * deviation, 1 - 1e-9)
+    lower = max(score - 1.96 * deviation, 1e-9)
+    margin = (-400 * math.log10(1 / upper - 1) + 400 * math.log10(1 / lower - 1)) / 2
+    return elo, margin
+
+
+"""
+Log likelihood ratio of elo1 against elo0 (the generalized SPRT with the
+normal approximation used by fishtest). The test accepts elo1 once the ratio
+reaches log((1 - beta) / alpha) and elo0 once it falls to log(beta / (1 - alpha))
+The counts get a prior of one game, scored as half a win, a draw and half a
+loss, so the variance is never 0: a run of nothing but wins still passes, and
+one of nothing but draws still fails. It hardly matters over a long match
+"""
+
+SPRT_PRIOR = (0.5, 1, 0.5)  # Wins, draws, losses added before the test
+
+
+def getLogLikelihoodRatio(wins, draws, losses, elo0, elo1):
+    if not wins + draws + losses:
+        return 0.0
+    wins += SPRT_PRIOR[0]
+    draws += SPRT_PRIOR[1]
+    losses += SPRT_PRIOR[2]
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (
+        wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score**2
+    ) / games
+    score0 = 1 / (1 + 10 ** (-elo0 / 400))
+    score1 = 1 / (1 + 10 ** (-elo1 / 400))
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def formatResults(engine, wins, draws, losses):
+    elo, margin = getEloDifference(wins, draws, losses)
+    return (
+        engine["name"]
+        + ": +"
+        + str(wins)
+        + " ="
+        + str(draws)
+        + " -"
+        + str(losses)
+        + "  Elo "
+        + format(elo, "+.1f")
+        + " +/- "
+        + format(margin, ".1f")
+    )
+
+
+def runMatch(
+    engines,
+    openings,
+    games,
+    concurrency=1,
+    pgnPath=None,
+    sprt=None,
+    alpha=0.05,
+    beta=0.05,
+):
+    first, second = engines
+    tasks = []
+    for gameNumber in range(games):
+        fen = openings[(gameNumber // 2) % len(openings)]
+        if gameNumber % 2 == 0:
+            tasks.append((gameNumber, fen, first, second, gameNumber))
+        else:
+            tasks.append((gameNumber, fen, second, first, gameNumber))
+    lowerBound = math.log(beta / (1 - alpha))
+    upperBound = math.log((1 - beta) / alpha)
+    wins = draws = losses = 0
+    pgnFile = open(pgnPath, "w") if pgnPath else None
+    pool = Pool(concurrency)
+    try:
+        for gameNumber, result, reason, sanMoves in pool.imap_unordered(
+            playGame, tasks
+        ):
+            _, fen, white, black, _ = tasks[gameNumber]
+            if pgnFile:
+                pgnFile.write(
+                    formatPGN(gameNumber, fen, white, black, result, reason, sanMoves)
+                )
+            if result == "1/2-1/2":
+                draws += 1
+            elif (result == "1-0") == (white is first):
+                wins += 1
+            else:
+                losses += 1
+            print(
+                "Game "
+                + str(gameNumber + 1)
+                + " "
+                + white["name"]
+                + " - "
+                + black["name"]
+                + " "
+                + result
+                + " ("
+                + reason
+                + ")  "
+                + formatResults(first, wins, draws, losses)
+            )
+            if sprt is not None:
+                ratio = getLogLikelihoodRatio(wins, draws, losses, sprt[0], sprt[1])
+                print(
+                    "SPRT llr "
+                    + format(ratio, ".2f")
+                    + " ["
+                    + format(lowerBound, ".2f")
+                    + ", "
+                    + format(upperBound, ".2f")
+                    + "]"
+                )
+                if ratio >= upperBound or ratio <= lowerBound:
+                    print(
+                        "SPRT: "
+                        + ("H1" if ratio >= upperBound else "H0")
+                        + " accepted, stopping"
+                    )
+                    break
+    finally:
+        pool.terminate()
+        pool.join()
+        if pgnFile:
+            pgnFile.close()
+    print(formatResults(first, wins, draws, losses))
+    return wins, draws, losses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless engine vs engine matches")
+    parser.add_argument(
+        "--engine",
+        nargs="+",
+        action="append",
+        metavar="KEY=VALUE",
+        help="Engine options, given twice (default: two default engines)",
+    )
+    parser.add_argument("--openings", help="FEN or EPD file, one position per line")
+    parser.add_argument("--games", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=1, help="Games at once")
+    parser.add_argument("--pgn", help="Write the games to this PGN file")
+    parser.add_argument(
+        "--sprt", type=float, nargs=2, metavar=("ELO0", "ELO1"), help="Stop by SPRT"
+    )
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args()
+    engineWords = args.engine or [[], []]
+    if len(engineWords) != 2:
+        parser.error("give --engine exactly twice, or not at all")
+    engines = [
+        parseEngine(words, number + 1) for number, words in enumerate(engineWords)
+    ]
+    if engines[0]["name"] == engines[1]["name"]:
+        parser.error("the two engines need different names")
+    openings = (
+        loadOpenings(args.openings) if args.openings else [ChessEngine.STARTING_FEN]
+    )
+    runMatch(
+        engines,
+        openings,
+        args.games,
+        args.concurrency,
+        args.pgn,
+        args.sprt,
+        args.alpha,
+        args.beta,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+"""
+Perft: count every position reachable in a given number of moves
+- Checks move generation against well known reference counts
+- Doubles as the move generation speed benchmark (nodes per second)
+
+Usage:
+    python ChessPerft.py                      Run the reference suite on both generators
+    python ChessPerft.py --fen FEN --depth 4  Count one position
+    python ChessPerft.py --depth 3 --divide   Counts per first move
+    python ChessPerft.py --backend scan       Only the board scan generator
+"""
+
+import argparse
+import time
+
+import ChessEngine
+
+STARTING_FEN = ChessEngine.STARTING_FEN
+BACKENDS = ("bitboard", "scan")  # Move generators the suite checks
+
+# (name, FEN, node counts for depth 1, 2, 3...)
+PERFT_SUITE = [
+    ("Start position", STARTING_FEN, [20, 400, 8902, 197281, 4865609]),
+    (
+        "Kiwipete",
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603],
+    ),
+    (
+        "Position 3",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624],
+    ),
+    (
+        "Position 4",
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333],
+    ),
+    (
+        "Position 4 mirrored",
+        "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+        [6, 264, 9467, 422333],
+    ),
+    (
+        "Position 5",
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487],
+    ),
+]
+
+"""
+Count the leaf positions depth moves ahead. The last ply is counted from the
+length of the move list without making the moves (bulk counting)
+"""
+
+
+def perft(gs, depth):
+    moves = gs.getValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+"""
+Perft split by first move, to find where two generators disagree
+"""
+
+
+def divide(gs, depth):
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[move.getChessNotation()] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+
+def runPerft(fen, depth, showDivide=False):
+    gs = ChessEngine.GameState.fromFEN(fen)
+    startTime = time.perf_counter()
+    if showDivide:
+        counts = divide(gs, depth)
+        for notation in sorted(counts):
+            print(notation + ": " + str(counts[notation]))
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(gs, depth)
+    seconds = time.perf_counter() - startTime
+    print(
+        "depth "
+        + str(depth)
+        + "  nodes "
+        + str(nodes)
+        + "  time "
+        + format(seconds, ".2f")
+        + "s  nps "
+        + str(int(nodes / seconds) if seconds > 0 else 0)
+    )
+    return nodes
+
+
+"""
+Run every suite position up to maxNodes leaf nodes. Returns True if all match
+"""
+
+
+def runSuite(maxNodes=1000000):
+    allPassed = True
+    totalNodes = 0
+    totalSeconds = 0.0
+    for name, fen, expectedCounts in PERFT_SUITE:
+        for depth, expected in enumerate(expectedCounts, 1):
+            if expected > maxNodes:
+                break
+            gs = ChessEngine.GameState.fromFEN(fen)
+            startTime = time.perf_counter()
+            nodes = perft(gs, depth)
+            seconds = time.perf_counter() - startTime
+            totalNodes += nodes
+            totalSeconds += seconds
+            passed = nodes == expected
+            allPassed = allPassed and passed
+            print(
+                ("ok    " if passed else "FAIL  ")
+                + name
+                + " depth "
+                + str(depth)
+                + ": "
+                + str(nodes)
+                + ("" if passed else " (expected " + str(expected) + ")")
+            )
+    print(
+        "Total "
+        + str(totalNodes)
+        + " nodes in "
+        + format(totalSeconds, ".2f")
+        + "s, "
+        + str(int(totalNodes / totalSeconds) if totalSeconds > 0 else 0)
+        + " nodes/s"
+    )
+    return allPassed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft for ChessEngine.GameState")
+    parser.add_argument("--fen", help="Position to count (default: reference suite)")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="Counts per first move")
+    parser.add_argument(
+        "--max-nodes",
+        type=int,
+        default=1000000,
+        help="Largest reference count to run in the suite",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        help="Move generator to use (default: the suite checks both, a single"
+        " position uses bitboard)",
+    )
+    args = parser.parse_args()
+    if args.fen is None and not args.divide:
+        allPassed = True
+        for backend in [args.backend] if args.backend else BACKENDS:
+            print("Backend " + backend)
+            ChessEngine.GameState.useBitboards = backend == "bitboard"
+            allPassed = runSuite(args.max_nodes) and allPassed
+        return 0 if allPassed else 1
+    ChessEngine.GameState.useBitboards = (args.backend or "bitboard") == "bitboard"
+    runPerft(args.fen or STARTING_FEN, args.depth, args.divide)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,93 @@
+"""
+Syzygy endgame tablebases
+- Probing is done by python-chess (pip install chess), which memory maps the
+  .rtbw (win/draw/loss) and .rtbz (distance to zeroing) files in a directory.
+  It is optional: without it, or without a directory, there are no tablebases
+- WDL results are kept in a small LRU cache by Zobrist key, since the search
+  reaches the same endgame positions over and over
+"""
+
+from collections import OrderedDict
+
+from ChessBitboard import popCount
+
+try:
+    import chess
+    import chess.syzygy
+except ImportError:
+    chess = None
+
+TABLEBASE_PIECES = 6  # Probe positions with at most this many pieces, kings included
+TABLEBASE_CACHE_SIZE = 65536  # WDL results kept
+
+
+class Tablebase:
+    def __init__(
+        self, directory, maxPieces=TABLEBASE_PIECES, cacheSize=TABLEBASE_CACHE_SIZE
+    ):
+        if chess is None:
+            raise ImportError("Syzygy tablebases need python-chess: pip install chess")
+        self.directory = directory
+        self.maxPieces = maxPieces
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict()
+        self.tables = chess.syzygy.open_tablebase(directory)
+
+    """
+    Tablebases have no castling, and only know the position, not how it was
+    reached: the search probes right after a capture or pawn move, when the
+    fifty move count can't change the result
+    """
+
+    def canProbe(self, gs):
+        return (
+            gs.castlingRights == 0
+            and popCount(gs.occupancy["w"] | gs.occupancy["b"]) <= self.maxPieces
+        )
+
+    """
+    2 the side to move wins, 0 draw, -2 loses; 1 and -1 are wins and losses
+    the fifty move rule turns into draws. None when no table has the position
+    """
+
+    def probeWDL(self, gs):
+        key = gs.zobristKey
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        wdl = self.tables.get_wdl(chess.Board(gs.toFEN()))
+        self.cache[key] = wdl
+        if len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+        return wdl
+
+    """
+    The move that keeps the best result for the side to move: the quickest
+    win (fewest moves to the next capture or pawn move, which the tables count
+    as DTZ), or the longest loss. None if a position after a move isn't in the
+    tables
+    """
+
+    def findRootMove(self, gs, validMoves):
+        bestMove = bestRank = None
+        for move in validMoves:
+            gs.makeMove(move)
+            board = chess.Board(gs.toFEN())
+            if board.is_checkmate():
+                rank = (3, 0)
+            else:
+                wdl = self.tables.get_wdl(board)
+                dtz = self.tables.get_dtz(board)
+                rank = None
+                if wdl is not None and dtz is not None:
+                    # Negated: the tables answer for the opponent
+                    rank = (-wdl, -abs(dtz) if wdl < 0 else abs(dtz))
+            gs.undoMove()
+            if rank is None:
+                return None
+            if bestRank is None or rank > bestRank:
+                bestMove, bestRank = move, rank
+        return bestMove
+
+    def close(self):
+        self.tables.close()
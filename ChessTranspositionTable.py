@@ -0,0 +1,108 @@
+"""
+Fixed size transposition table
+- Remembers the result of searching a position, keyed by its Zobrist key
+- Entries live in flat arrays, so memory use is set once by the size in MB
+- Each bucket has two slots: one kept for the deepest search, one always replaced
+- With shared=True the arrays live in shared memory, so several search
+  processes can read and write the same table (Lazy SMP)
+"""
+
+import ctypes
+from array import array
+from multiprocessing.sharedctypes import RawArray
+
+EXACT = 0
+LOWER_BOUND = 1  # Search failed high: score is at least this
+UPPER_BOUND = 2  # Search failed low: score is at most this
+
+BYTES_PER_ENTRY = 8 + 8  # key, data
+SCORE_OFFSET = 1 << 31  # Scores are stored as 32 bit unsigned numbers
+
+
+class TranspositionTable:
+    def __init__(self, sizeMB=16, shared=False):
+        buckets = 1
+        while (buckets * 2) * 2 * BYTES_PER_ENTRY <= sizeMB * 1024 * 1024:
+            buckets *= 2
+        self.sizeMB = sizeMB
+        self.shared = shared
+        self.bucketMask = buckets - 1
+        self.size = buckets * 2
+        # data: bits 0-7 depth, 8-9 bound, 10-25 best move (0 = none), 26-57 score
+        # keys holds key ^ data, so an entry half written by another process
+        # doesn't match any key and reads as a miss
+        if shared:
+            self.keys = RawArray("Q", self.size)
+            self.data = RawArray("Q", self.size)
+        else:
+            self.keys = array("Q", [0]) * self.size
+            self.data = array("Q", [0]) * self.size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def clear(self):
+        if self.shared:  # Other processes hold the same arrays, so zero them in place
+            ctypes.memset(self.keys, 0, ctypes.sizeof(self.keys))
+            ctypes.memset(self.data, 0, ctypes.sizeof(self.data))
+        else:
+            self.keys = array("Q", [0]) * self.size
+            self.data = array("Q", [0]) * self.size
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    """
+    Returns (depth, score, bound, move) for a stored position, or None
+    """
+
+    def probe(self, key):
+        index = (key & self.bucketMask) << 1
+        data = self.data[index]
+        if self.keys[index] ^ data != key:
+            index += 1
+            data = self.data[index]
+            if self.keys[index] ^ data != key:
+                self.misses += 1
+                return None
+        self.hits += 1
+        return (
+            data & 0xFF,
+            ((data >> 26) & 0xFFFFFFFF) - SCORE_OFFSET,
+            (data >> 8) & 3,
+            (data >> 10) & 0xFFFF,
+        )
+
+    """
+    Depth preferred slot first: it is only replaced by the same position or an
+    equal or deeper search. Everything else goes to the always replace slot
+    """
+
+    def store(self, key, depth, score, bound, move=0):
+        index = (key & self.bucketMask) << 1
+        keys = self.keys
+        oldData = self.data[index]
+        if keys[index] ^ oldData != key and depth < oldData & 0xFF:
+            index += 1
+            oldData = self.data[index]
+        storedKey = keys[index] ^ oldData
+        if storedKey != key and storedKey != 0:
+            self.overwrites += 1
+        if move == 0 and storedKey == key:  # Keep the old best move
+            move = (oldData >> 10) & 0xFFFF
+        self.stores += 1
+        data = depth | bound << 8 | move << 10 | (score + SCORE_OFFSET) << 26
+        self.data[index] = data
+        keys[index] = key ^ data
+
+    def getStats(self):
+        probes = self.hits + self.misses
+        used = sum(1 for data in self.data if data != 0)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / probes if probes else 0.0,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "entries": self.size,
+            "filled": used / self.size,
+        }
@@ -0,0 +1,244 @@
+"""
+UCI (Universal Chess Interface) front end
+- Reads commands on stdin and answers on stdout, so tournament managers and
+  GUIs can run the engine as a normal chess engine process
+- The search runs on its own thread, so stop and isready are answered while it
+  is thinking
+
+Usage:
+    python ChessUCI.py
+"""
+
+import sys
+import threading
+
+import ChessAI
+import ChessBook
+import ChessEngine
+import ChessTablebase
+
+ENGINE_NAME = "chess-engine-youtube"
+ENGINE_AUTHOR = "bpark67"
+MOVES_TO_GO = 30  # Moves the remaining clock is shared over when not told
+MOVE_OVERHEAD = 0.05  # Seconds kept back for communication per move
+
+
+class UCIEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.gs = ChessEngine.GameState()
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+        self.searcher = ChessAI.Searcher()
+        self.searcher.infoCallback = self.sendInfo
+        self.bookPath = None
+        self.bookDepth = ChessBook.BOOK_DEPTH
+        self.tablebasePath = None
+        self.tablebasePieces = ChessTablebase.TABLEBASE_PIECES
+
+    def send(self, text):
+        with self.outputLock:
+            self.output.write(text + "\n")
+            self.output.flush()
+
+    """
+    Handle one line of input. Returns False on quit
+    """
+
+    def handleCommand(self, line):
+        words = line.split()
+        if not words:
+            return True
+        command = words[0]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send(
+                "option name Hash type spin default "
+                + str(ChessAI.TRANSPOSITION_TABLE_MB)
+                + " min 1 max 4096"
+            )
+            self.send("option name Threads type spin default 1 min 1 max 256")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name SyzygyPath type string default <empty>")
+            self.send(
+                "option name SyzygyProbeLimit type spin default "
+                + str(ChessTablebase.TABLEBASE_PIECES)
+                + " min 0 max 7"
+            )
+            self.send(
+                "option name BookDepth type spin default "
+                + str(ChessBook.BOOK_DEPTH)
+                + " min 0 max 1000"
+            )
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setOption(words)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.searcher.transpositionTable.clear()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(words)
+        elif command == "go":
+            self.stopSearch()
+            self.startSearch(words)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        return True
+
+    def setOption(self, words):
+        if "name" not in words or "value" not in words:
+            return
+        name = " ".join(words[words.index("name") + 1 : words.index("value")])
+        value = " ".join(words[words.index("value") + 1 :])
+        if name.lower() == "hash":
+            self.searcher.setTranspositionTableSize(int(value))
+        elif name.lower() == "threads":
+            self.searcher.workers = max(1, int(value))
+        elif name.lower() == "bookfile":
+            self.bookPath = value if value not in ("", "<empty>") else None
+            self.searcher.setBook(self.bookPath, self.bookDepth)
+        elif name.lower() == "bookdepth":
+            self.bookDepth = int(value)
+            self.searcher.setBook(self.bookPath, self.bookDepth)
+        elif name.lower() == "syzygypath":
+            self.tablebasePath = value if value not in ("", "<empty>") else None
+            try:
+                self.searcher.setTablebase(self.tablebasePath, self.tablebasePieces)
+            except ImportError as error:
+                self.send("info string " + str(error))
+        elif name.lower() == "syzygyprobelimit":
+            self.tablebasePieces = int(value)
+            if self.searcher.tablebase is not None:
+                self.searcher.tablebase.maxPieces = self.tablebasePieces
+
+    """
+    position startpos [moves e2e4 ...] or position fen <FEN> [moves ...]
+    """
+
+    def setPosition(self, words):
+        if "moves" in words:
+            movesIndex = words.index("moves")
+        else:
+            movesIndex = len(words)
+        if len(words) > 1 and words[1] == "fen":
+            try:
+                gs = ChessEngine.GameState.fromFEN(" ".join(words[2:movesIndex]))
+            except ValueError as error:  # Keep the previous position
+                self.send("info string bad fen: " + str(error))
+                return
+        else:
+            gs = ChessEngine.GameState()
+        for notation in words[movesIndex + 1 :]:
+            for move in gs.getValidMoves():
+                if move.getChessNotation() == notation:
+                    gs.makeMove(move)
+                    break
+            else:
+                self.send("info string illegal move " + notation)
+                break
+        self.gs = gs
+
+    def startSearch(self, words):
+        limits = {}
+        for key in ("wtime", "btime", "winc", "binc", "movestogo", "movetime"):
+            if key in words:
+                limits[key] = int(words[words.index(key) + 1]) / 1000
+        depth = nodes = None
+        if "depth" in words:
+            depth = int(words[words.index("depth") + 1])
+        if "nodes" in words:
+            nodes = int(words[words.index("nodes") + 1])
+        infinite = "infinite" in words
+        timeLimit = None
+        if "movetime" in limits:
+            timeLimit = max(limits["movetime"] - MOVE_OVERHEAD, 0.01)
+        elif not infinite:
+            color = "w" if self.gs.whiteToMove else "b"
+            if color + "time" in limits:
+                remaining = limits[color + "time"]
+                movesToGo = limits.get("movestogo", MOVES_TO_GO)
+                timeLimit = remaining / movesToGo + limits.get(color + "inc", 0) / 2
+                timeLimit = max(min(timeLimit, remaining - MOVE_OVERHEAD), 0.01)
+        if depth is None and (infinite or timeLimit is not None or nodes is not None):
+            depth = ChessAI.MAX_DEPTH
+        self.stopEvent = threading.Event()
+        self.searchThread = threading.Thread(
+            target=self.search,
+            args=(timeLimit, nodes, depth, infinite, self.stopEvent),
+            daemon=True,
+        )
+        self.searchThread.start()
+
+    """
+    Always answers with bestmove, even if the search fails, so the GUI is never
+    left waiting
+    """
+
+    def search(self, timeLimit, nodes, depth, infinite, stopEvent):
+        self.searcher.stopSignal = stopEvent
+        validMoves = []
+        bestMove = None
+        try:
+            validMoves = self.gs.getValidMoves()
+            if validMoves:
+                bestMove = self.searcher.findBestMoveParallel(
+                    self.gs, list(validMoves), timeLimit, nodes, depth
+                )
+        except Exception as error:
+            self.send("info string search failed: " + repr(error))
+        finally:
+            if bestMove is None and validMoves:
+                bestMove = validMoves[0]
+            if infinite:  # The GUI decides when an infinite search is over
+                stopEvent.wait()
+            self.send(
+                "bestmove " + (bestMove.getChessNotation() if bestMove else "0000")
+            )
+
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+    def sendInfo(self, depth, score, nodes, seconds, pv):
+        if abs(score) >= ChessAI.CHECKMATE:
+            movesToMate = (len(pv) + 1) // 2
+            scoreText = "mate " + str(movesToMate if score > 0 else -movesToMate)
+        else:
+            scoreText = "cp " + str(score)
+        self.send(
+            "info depth "
+            + str(depth)
+            + " score "
+            + scoreText
+            + " nodes "
+            + str(nodes)
+            + " nps "
+            + str(int(nodes / seconds) if seconds > 0 else 0)
+            + " time "
+            + str(int(seconds * 1000))
+            + " pv "
+            + " ".join(move.getChessNotation() for move in pv)
+        )
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handleCommand(line):
+            break
+    engine.stopSearch()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,206 @@
+"""
+Long lived search process
+- Started once and reused for every AI move, so the transposition table and the
+  process itself stay warm between moves
+- A request is the starting FEN plus the moveIDs played since. The worker only
+  plays the moves it hasn't seen (undoing any that were taken back), instead of
+  receiving a pickled GameState every move
+- cancel() asks the running search to stop and report its best move so far,
+  instead of killing the process
+- With more than one worker the Lazy SMP helpers are started once with it too,
+  and get the same requests as the main search, instead of new processes and a
+  pickled GameState every move
+"""
+
+import atexit
+import queue
+import random
+from multiprocessing import Process, Queue, RawValue
+
+import ChessAI
+import ChessEngine
+
+"""
+Looks like an Event to the search: set once requestNumber has been cancelled
+"""
+
+
+class RequestCancelled:
+    def __init__(self, cancelledRequest, requestNumber):
+        self.cancelledRequest = cancelledRequest
+        self.requestNumber = requestNumber
+
+    def is_set(self):
+        return self.cancelledRequest.value >= self.requestNumber
+
+
+class SearchWorker:
+    def __init__(self, workers=1, bookPath=None, tablebasePath=None):
+        self.requestQueue = Queue()
+        self.resultQueue = Queue()
+        self.cancelledRequest = RawValue("l", 0)  # Highest cancelled request
+        self.requestNumber = 0
+        self.bestMoveID = None
+        self.done = True
+        # Not a daemon, so it may start Lazy SMP helpers of its own
+        self.process = Process(
+            target=runSearchWorker,
+            args=(
+                self.requestQueue,
+                self.resultQueue,
+                self.cancelledRequest,
+                workers,
+                bookPath,
+                tablebasePath,
+            ),
+        )
+        self.process.start()
+        atexit.register(self.close)
+
+    """
+    Start searching the position gs is in. The result is collected with poll()
+    """
+
+    def search(self, gs, timeLimit=None, nodeLimit=None):
+        self.requestNumber += 1
+        self.done = False
+        self.bestMoveID = None
+        self.requestQueue.put(
+            (
+                self.requestNumber,
+                gs.startFEN,
+                [move.moveID for move in gs.moveLog],
+                timeLimit,
+                nodeLimit,
+            )
+        )
+
+    """
+    Stop the current search. Its result is thrown away when it arrives
+    """
+
+    def cancel(self):
+        self.cancelledRequest.value = self.requestNumber
+        self.done = True
+
+    """
+    True once the latest search has finished. bestMoveID is then its move, or
+    None if it found none
+    """
+
+    def poll(self):
+        while not self.done:
+            try:
+                requestNumber, moveID = self.resultQueue.get_nowait()
+            except queue.Empty:
+                break
+            if requestNumber == self.requestNumber:
+                self.bestMoveID = moveID
+                self.done = True
+        return self.done
+
+    def close(self):
+        if self.process.is_alive():
+            self.cancel()
+            self.requestQueue.put(None)
+            self.process.join()
+
+
+def runSearchWorker(
+    requestQueue, resultQueue, cancelledRequest, workers, bookPath, tablebasePath
+):
+    gs = ChessEngine.GameState()
+    searcher = ChessAI.Searcher(
+        bookPath=bookPath, tablebasePath=tablebasePath, sharedTable=workers > 1
+    )
+    finishedRequest = RawValue("l", 0)  # Highest request the main search is done with
+    helperQueues = []
+    helpers = []
+    for helperNumber in range(1, workers):
+        helperQueue = Queue()
+        helper = Process(
+            target=runHelperWorker,
+            args=(
+                helperQueue,
+                finishedRequest,
+                searcher.getSettings(),
+                searcher.transpositionTable,
+                helperNumber,
+            ),
+            daemon=True,
+        )
+        helper.start()
+        helperQueues.append(helperQueue)
+        helpers.append(helper)
+    while True:
+        request = requestQueue.get()
+        if request is None:
+            break
+        requestNumber, startFEN, moveIDs, timeLimit, nodeLimit = request
+        if cancelledRequest.value >= requestNumber:
+            continue
+        for helperQueue in helperQueues:
+            helperQueue.put(request)
+        catchUp(gs, startFEN, moveIDs)
+        searcher.stopSignal = RequestCancelled(cancelledRequest, requestNumber)
+        try:
+            bestMove = searcher.findBestMoveIterative(
+                gs, gs.getValidMoves(), timeLimit, nodeLimit
+            )
+        finally:
+            finishedRequest.value = requestNumber  # Stops the helpers
+        resultQueue.put((requestNumber, bestMove.moveID if bestMove else None))
+    for helperQueue in helperQueues:
+        helperQueue.put(None)
+    for helper in helpers:
+        helper.join()
+
+
+"""
+A Lazy SMP helper for the whole game: searches each request on the shared
+table until the main search is done with it, and reports nothing
+"""
+
+
+def runHelperWorker(helperQueue, finishedRequest, settings, table, helperNumber):
+    gs = ChessEngine.GameState()
+    searcher = ChessAI.Searcher(transpositionTable=table, **settings)
+    searcher.isHelper = True
+    while True:
+        request = helperQueue.get()
+        if request is None:
+            break
+        requestNumber, startFEN, moveIDs, timeLimit, nodeLimit = request
+        if finishedRequest.value >= requestNumber:
+            continue
+        catchUp(gs, startFEN, moveIDs)
+        searcher.stopSignal = RequestCancelled(finishedRequest, requestNumber)
+        random.seed(helperNumber)
+        searcher.findBestMoveIterative(
+            gs,
+            gs.getValidMoves(),
+            timeLimit,
+            nodeLimit,
+            None,
+            1 + helperNumber % 2,
+        )
+
+
+"""
+Bring gs to startFEN + moveIDs: undo back to the moves both have in common, then
+play the rest. A different starting position means starting over
+"""
+
+
+def catchUp(gs, startFEN, moveIDs):
+    if gs.startFEN != startFEN:
+        gs.loadFEN(startFEN)
+    common = 0
+    for move, moveID in zip(gs.moveLog, moveIDs):
+        if move.moveID != moveID:
+            break
+        common += 1
+    while len(gs.moveLog) > common:
+        gs.undoMove()
+    for moveID in moveIDs[common:]:
+        gs.makeMove(ChessEngine.Move.fromID(moveID, gs.board))